@@ -1,14 +1,31 @@
+import argparse
+import codecs
+import difflib
 import logging
+import mmap
+import os
+import tempfile
 import threading
+import time
+import zlib
 import sounddevice as sd
 import numpy as np
+from scipy.io import wavfile
 import tkinter as tk
 from tkinter import messagebox
+from tkinter import filedialog
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
 import base64
 import binascii
 
+# Encodages, détection, grille des symboles et index : module partagé avec Lyrivox-S et Lyrivox-SRV
+from lyrivox_signal import (
+    encode_rot13, freq_to_char, freq_to_bit, get_dominant_freq,
+    symbol_offsets, symbol_count, decode_symbols, make_index, write_index, load_index, index_path, index_block_chars,
+    default_durations, generators, text_to_freq,
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,43 +39,374 @@ logging.basicConfig(
 
 # Audio parameters
 sample_rate = 44100
-chunk_duration = 0.1
-chunk_size = int(sample_rate * chunk_duration)
-
-# Mappage Fréquence vers Caractère
-def freq_to_char(freq):
-    code = int(round((freq - 1000) / 10))
-    if 32 <= code <= 126:
-        return chr(code)
-    return None
-
-# Mappage Fréquence vers Bit
-def freq_to_bit(freq):
-    if 950 <= freq <= 1050:
-        return 0
-    if 1950 <= freq <= 2050:
-        return 1
-    return None
-
-# Extraction de la fréquence dominante
-def get_dominant_freq(data, rate):
-    window = np.hanning(len(data))
-    fft = np.abs(np.fft.rfft(data * window))
-    freqs = np.fft.rfftfreq(len(data), d=1/rate)
-    max_amplitude = np.max(fft)
-    if max_amplitude < 1e-4:
-        return 0
-    dominant_freq_index = np.argmax(fft)
-    return freqs[dominant_freq_index]
-
-# Fonction d'encodage Inverser (copiée depuis le générateur pour le post-traitement)
-def encode_reverse(text):
-    """Inverse simplement la chaîne de caractères."""
-    return text[::-1]
+
+# Réglages du décodeur selon la forme d'onde du générateur.
+# "block" : un caractère par bloc, les répétitions sont ignorées (ou lues comme un espace).
+# "run" : blocs d'un quart de symbole analysés sur une fenêtre glissante ; un symbole est émis à la fin
+# de sa série de blocs, autant de fois que la durée de la série le justifie (lettres doublées comprises).
+# "Phase continue" : symboles sans silence, fréquence affinée par interpolation.
+# symbol_duration est la durée par caractère proposée par défaut par le générateur pour cette forme d'onde :
+# les blocs durent symbol_duration / chunks_per_symbol, le détecteur "run" en dépend directement.
+decoder_profiles = {
+    "Classique": {"symbol_duration": default_durations["Classique"], "interpolate": False, "consecutive_threshold": 3,
+                  "detector": "block", "window_chunks": 1, "chunks_per_symbol": 1, "min_run": 1},
+    "Phase continue": {"symbol_duration": default_durations["Phase continue"], "interpolate": True, "consecutive_threshold": None,
+                       "detector": "run", "window_chunks": 2, "chunks_per_symbol": 4, "min_run": 2},
+}
+min_chunk_size = 256 # Plus petit bloc analysable (~6 ms à 44,1 kHz, bins FFT de 170 Hz avant interpolation)
+
+def decoder_chunk_size(profile, settings=None):
+    """Taille (échantillons) des blocs audio lus par le décodeur pour ce profil et ces réglages."""
+    settings = {**decoder_profiles[profile], **(settings or {})}
+    return int(sample_rate * settings["symbol_duration"] / settings["chunks_per_symbol"])
+
+# Bornes mémoire pour les longues sessions de décodage
+transcript_tail_chars = 64 * 1024 # Caractères gardés en mémoire, le reste part sur disque
+max_display_chars = 100000 # Caractères gardés dans la zone de sortie
+
+# Capture brute optionnelle (anneau sur disque) pour rejouer une session hors ligne
+capture_path_pattern = "capture_lyrivox_%Y%m%d_%H%M%S.lyrcap" # Un fichier par session : un redémarrage n'écrase pas l'incident
+capture_seconds = 600 # Durée conservée : ~100 Mo à 44,1 kHz en float32
+
+# Assemble les bits reçus en octets dans un registre à décalage (mode binaire)
+class BitPacker:
+    def __init__(self):
+        self.register = 0
+        self.count = 0
+
+    def push(self, bit):
+        """Ajoute un bit (MSB en premier). Renvoie l'octet complété, sinon None."""
+        self.register = (self.register << 1) | bit
+        self.count += 1
+        if self.count < 8:
+            return None
+        value = self.register
+        self.register = 0
+        self.count = 0
+        return value
+
+    def pending(self):
+        """Bits en attente sous forme de chaîne, pour le journal."""
+        return format(self.register, f'0{self.count}b') if self.count else ''
+
+# Transcription en ajout seul : une queue bornée en mémoire, le début déversé dans un fichier mappé
+class TranscriptStore:
+    def __init__(self, path=None, tail_chars=transcript_tail_chars, initial_capacity=1024 * 1024):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="lyrivox_transcript_", suffix=".txt")
+            os.close(fd)
+            self._owns_file = True
+        else:
+            self._owns_file = False
+        self.path = path
+        self.tail_chars = tail_chars
+        self._lock = threading.Lock()
+        self._tail = []
+        self._tail_len = 0
+        self._last = None
+        self._spilled = 0 # Octets UTF-8 déjà écrits dans le fichier
+        self._spilled_chars = 0
+        self._file = open(path, 'w+b')
+        self._capacity = 0
+        self._map = None
+        self._reserve(initial_capacity)
+
+    def _reserve(self, needed):
+        """Agrandit le fichier (par doublement) et le remappe si nécessaire."""
+        if needed <= self._capacity:
+            return
+        capacity = max(self._capacity, 1024)
+        while capacity < needed:
+            capacity *= 2
+        if self._map is not None:
+            self._map.close()
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self._capacity = capacity
+
+    def _spill(self):
+        """Écrit la moitié la plus ancienne de la queue dans le fichier mappé."""
+        text = ''.join(self._tail)
+        keep = self.tail_chars // 2
+        old, recent = text[:-keep], text[-keep:]
+        data = old.encode('utf-8')
+        self._reserve(self._spilled + len(data))
+        self._map[self._spilled:self._spilled + len(data)] = data
+        self._spilled += len(data)
+        self._spilled_chars += len(old)
+        self._tail = [recent]
+        self._tail_len = len(recent)
+
+    def append(self, text):
+        if not text:
+            return
+        with self._lock:
+            self._tail.append(text)
+            self._tail_len += len(text)
+            self._last = text[-1]
+            if self._tail_len > self.tail_chars:
+                self._spill()
+
+    def last_char(self):
+        return self._last
+
+    def __len__(self):
+        with self._lock:
+            return self._spilled_chars + self._tail_len
+
+    def __bool__(self):
+        return self._last is not None
+
+    def iter_chunks(self, chunk_bytes=1024 * 1024):
+        """Parcourt la transcription complète par morceaux, sans la charger en entier."""
+        with self._lock:
+            spilled = self._spilled
+            tail = ''.join(self._tail)
+        pending = b''
+        for start in range(0, spilled, chunk_bytes):
+            # Lecture sous le verrou : un déversement concurrent peut remapper le fichier
+            with self._lock:
+                data = pending + self._map[start:min(start + chunk_bytes, spilled)]
+            # Ne coupe pas un caractère UTF-8 multi-octets entre deux morceaux
+            cut = len(data)
+            while cut > 0 and (data[cut - 1] & 0xC0) == 0x80:
+                cut -= 1
+            if cut > 0 and data[cut - 1] >= 0xC0:
+                cut -= 1
+            pending = data[cut:]
+            yield data[:cut].decode('utf-8', errors='replace')
+        if pending:
+            yield pending.decode('utf-8', errors='replace')
+        if tail:
+            yield tail
+
+    def iter_reversed(self, chunk_bytes=1024 * 1024):
+        """Parcourt la transcription inversée (du dernier caractère au premier) par morceaux."""
+        with self._lock:
+            spilled = self._spilled
+            tail = ''.join(self._tail)
+        if tail:
+            yield tail[::-1]
+        pending = b''
+        for end in range(spilled, 0, -chunk_bytes):
+            with self._lock:
+                data = self._map[max(0, end - chunk_bytes):end] + pending
+            # Le début d'un caractère UTF-8 coupé reste pour le morceau suivant (plus ancien)
+            cut = 0
+            while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+                cut += 1
+            pending = data[:cut]
+            yield data[cut:].decode('utf-8', errors='replace')[::-1]
+        if pending:
+            yield pending.decode('utf-8', errors='replace')[::-1]
+
+    def tail(self, chars):
+        """Les derniers caractères de la transcription (au plus chars), sans relire le début."""
+        with self._lock:
+            text = ''.join(self._tail)
+            if len(text) < chars and self._spilled:
+                # 4 octets au plus par caractère UTF-8
+                data = self._map[max(0, self._spilled - 4 * (chars - len(text))):self._spilled]
+                cut = 0
+                while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+                    cut += 1
+                text = data[cut:].decode('utf-8', errors='replace') + text
+        return text[-chars:]
+
+    def read(self):
+        return ''.join(self.iter_chunks())
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for chunk in self.iter_chunks():
+                f.write(chunk)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if not self._file.closed:
+                self._file.truncate(self._spilled)
+                self._file.close()
+        if self._owns_file:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logging.warning(f"Could not remove transcript file {self.path}: {e}")
+
+# Post-traitement en flux : la transcription est lue par morceaux, le résultat va dans un autre TranscriptStore
+valid_base64_chars = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")
+
+def strip_chunks(chunks):
+    """Équivalent de ''.join(chunks).strip(), morceau par morceau (aucun morceau vide n'est renvoyé)."""
+    started = False
+    spaces = ''
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        body = chunk.rstrip()
+        if body:
+            yield spaces + body
+            spaces = chunk[len(body):]
+        else:
+            spaces += chunk
+
+def same_chunks(a, b):
+    """Compare deux textes découpés différemment, sans les assembler."""
+    a, b = iter(a), iter(b)
+    x = y = ''
+    while True:
+        while x == '':
+            x = next(a, None)
+        while y == '':
+            y = next(b, None)
+        if x is None or y is None:
+            return x is None and y is None
+        n = min(len(x), len(y))
+        if x[:n] != y[:n]:
+            return False
+        x, y = x[n:], y[n:]
+
+def base64_decode_chunks(chunks, out):
+    """Décode en flux le Base64 capturé (caractères invalides ignorés) et écrit le texte dans out.
+    Renvoie le message à afficher après le résultat (erreur, décodage partiel), ou None."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    used = 0 # Caractères Base64 déjà décodés
+    try:
+        for chunk in chunks:
+            pending += ''.join(c for c in chunk if c in valid_base64_chars)
+            cut = len(pending) // 4 * 4
+            if cut:
+                out.append(decoder.decode(base64.b64decode(pending[:cut])))
+                used += cut
+                pending = pending[cut:]
+        if not used and not pending:
+            message = "ERREUR_DECODAGE_BASE64: L'entrée capturée ne contient aucun caractère Base64 valide."
+            logging.warning(message)
+            return message
+        if pending:
+            # Dernier groupe incomplet : complété par le padding, comme un décodage standard
+            out.append(decoder.decode(base64.b64decode(pending + '=' * ((4 - len(pending) % 4) % 4))))
+        out.append(decoder.decode(b'', final=True))
+        logging.info("Base64 decoding successful.")
+        return None
+    except binascii.Error as e:
+        out.append(decoder.decode(b'', final=True))
+        if not used:
+            logging.error(f"BinASCII error during Base64 decode: {e}", exc_info=True)
+            return (f"ERREUR_BASE64 (Format/Padding): {e}\n"
+                    "(La chaîne capturée, même nettoyée et paddée, n'est pas du Base64 valide.)")
+        logging.warning(f"Base64 partial decode successful ({used} chars) before error: {e}")
+        return f"\n\n(ATTENTION: Décodage partiel réussi à partir des {used} premiers caractères. Le reste a été ignoré.)"
+
+# Capture brute en anneau : blocs float32 horodatés dans un fichier mappé de taille fixe
+class CaptureRing:
+    magic = b"LYRCAP01"
+    header_dtype = np.dtype([('magic', 'S8'), ('rate', '<u4'), ('block', '<u4'), ('slots', '<u8'), ('written', '<u8'), ('reserved', 'V32')])
+
+    def __init__(self, path, mode, rate=None, block=None, slots=None):
+        """mode 'w+' crée (ou écrase) la capture, mode 'r' l'ouvre en lecture pour un rejeu."""
+        if mode == 'w+':
+            self._header = np.memmap(path, dtype=self.header_dtype, mode='w+', shape=(1,))
+            self._header['magic'] = self.magic
+            self._header['rate'] = rate
+            self._header['block'] = block
+            self._header['slots'] = slots
+            self._header['written'] = 0
+            self._header.flush()
+        else:
+            self._header = np.memmap(path, dtype=self.header_dtype, mode='r', shape=(1,))
+            if self._header['magic'][0] != self.magic:
+                raise ValueError(f"{path} n'est pas un fichier de capture Lyrivox.")
+        self.path = path
+        self.writable = mode == 'w+'
+        self.rate = int(self._header['rate'][0])
+        self.block = int(self._header['block'][0])
+        self.slots = int(self._header['slots'][0])
+        self.slot_dtype = np.dtype([('time', '<f8'), ('frames', '<u4'), ('status', '<u4'), ('samples', '<f4', (self.block,))])
+        self._blocks = np.memmap(path, dtype=self.slot_dtype, mode='r+' if self.writable else 'r',
+                                 offset=self.header_dtype.itemsize, shape=(self.slots,))
+        # Vues par champ préparées une fois : le callback audio ne fait que des copies
+        self._times = self._blocks['time']
+        self._frames = self._blocks['frames']
+        self._status = self._blocks['status']
+        self._samples = self._blocks['samples']
+        self._written = int(self._header['written'][0])
+
+    @classmethod
+    def create(cls, path, seconds, block, rate=sample_rate):
+        """block doit être la taille des blocs du décodeur : un emplacement par bloc reçu."""
+        slots = max(1, int(seconds * rate / block))
+        return cls(path, 'w+', rate, block, slots)
+
+    @classmethod
+    def open(cls, path):
+        return cls(path, 'r')
+
+    def write(self, samples, status=0):
+        """Appelé depuis le callback audio : copie le bloc dans l'anneau (status = 1 si incident signalé)."""
+        slot = self._written % self.slots
+        n = min(len(samples), self.block)
+        self._times[slot] = time.time()
+        self._frames[slot] = n
+        self._status[slot] = int(status)
+        self._samples[slot, :n] = samples[:n]
+        self._written += 1
+        # Compteur mis à jour après les données : un lecteur ne voit jamais un bloc à moitié annoncé
+        self._header['written'] = self._written
+
+    def order(self):
+        """Indices des blocs conservés, du plus ancien au plus récent."""
+        written = int(self._header['written'][0])
+        kept = min(written, self.slots)
+        return [(written - kept + i) % self.slots for i in range(kept)]
+
+    def span(self):
+        """(début, fin) des blocs conservés, en secondes depuis l'époque, ou None si vide."""
+        order = self.order()
+        if not order:
+            return None
+        return float(self._times[order[0]]), float(self._times[order[-1]]) + self.block / self.rate
+
+    def read(self, start=None, end=None):
+        """Échantillons conservés entre start et end (secondes depuis le premier bloc conservé)."""
+        order = self.order()
+        if not order:
+            return np.zeros(0, dtype=np.float32)
+        # Fenêtre comptée en échantillons reçus (exacte), les horodatages servent à recouper avec le journal
+        first = 0 if start is None else int(start * self.rate)
+        last = None if end is None else int(end * self.rate)
+        chunks = []
+        position = 0
+        for slot in order:
+            frames = int(self._frames[slot])
+            lo, hi = max(first - position, 0), frames if last is None else min(last - position, frames)
+            if lo < hi:
+                chunks.append(self._samples[slot, lo:hi])
+            position += frames
+            if last is not None and position >= last:
+                break
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(chunks)
+
+    def close(self):
+        if self.writable:
+            self._blocks.flush()
+            self._header.flush()
+        self._times = self._frames = self._status = self._samples = None
+        self._blocks = None
+        self._header = None
 
 # Classe pour gérer l'écoute et le décodage audio en arrière-plan
 class AudioDecoder(threading.Thread):
-    def __init__(self, mode, output_widget=None, on_stop=None, status_var=None):
+    def __init__(self, mode, output_widget=None, on_stop=None, status_var=None, transcript=None, profile="Classique",
+                 base_freq=1000, capture=None, settings=None):
         super().__init__(daemon=True)
         self.root = output_widget.winfo_toplevel() if output_widget else None
         self.mode = mode
@@ -68,23 +416,43 @@ class AudioDecoder(threading.Thread):
         self.status_var = status_var
         self._stop_event = threading.Event()
         self.stream = None
-        self.bits_buffer = []
-        self.text_buffer = []
+        self.bits = BitPacker()
+        self.transcript = transcript if transcript is not None else TranscriptStore()
+        self.capture = capture
+        self.base_freq = base_freq
         self.decoding = False
 
         self.last_char = None
         self.consecutive_count = 0
-        self.consecutive_threshold = 3
+        # settings remplace des valeurs du profil (rejeu d'une capture avec d'autres réglages)
+        settings = {**decoder_profiles[profile], **(settings or {})}
+        self.profile = profile
+        self.symbol_duration = settings["symbol_duration"]
+        self.chunk_duration = self.symbol_duration / settings["chunks_per_symbol"]
+        self.chunk_size = decoder_chunk_size(profile, settings)
+        if self.chunk_size < min_chunk_size:
+            raise ValueError(f"Durée par caractère trop courte pour le profil '{profile}' : "
+                             f"blocs de {self.chunk_size} échantillons (minimum {min_chunk_size}).")
+        self.interpolate = settings["interpolate"]
+        self.consecutive_threshold = settings["consecutive_threshold"]
+        self.detector = settings["detector"]
+        self.window_chunks = settings["window_chunks"]
+        self.chunks_per_symbol = settings["chunks_per_symbol"]
+        self.min_run = settings["min_run"]
+        self._window = []
+        self.run_symbol = None
+        self.run_length = 0
 
     def run(self):
         self.decoding = True
         if self.status_var: self.status_var.set("🎙️ Démarrage du flux audio...")
-        logging.info(f"Attempting to start audio stream with sample rate {sample_rate}, block size {chunk_size}.")
+        logging.info(f"Attempting to start audio stream with sample rate {sample_rate}, block size {self.chunk_size} "
+                     f"('{self.profile}' profile, {self.symbol_duration} s per symbol).")
         try:
             with sd.InputStream(
                 channels=1,
                 samplerate=sample_rate,
-                blocksize=chunk_size,
+                blocksize=self.chunk_size,
                 callback=self.callback,
                 dtype='float32',
                 latency='low'
@@ -93,7 +461,7 @@ class AudioDecoder(threading.Thread):
                 if self.status_var: self.status_var.set(f"👂 Écoute démarrée en mode '{self.mode}'...")
                 logging.info(f"Stream started successfully in '{self.mode}' mode.")
                 while not self._stop_event.is_set():
-                    sd.sleep(int(chunk_duration * 1000))
+                    sd.sleep(int(self.chunk_duration * 1000))
         except sd.PortAudioError as e:
             logging.error(f"PortAudio error during stream operation: {e}", exc_info=True)
             if self.status_var: self.status_var.set("❌ Erreur PortAudio !")
@@ -111,8 +479,12 @@ class AudioDecoder(threading.Thread):
             if self.root and self.root.winfo_exists():
                  self.root.after(0, lambda: messagebox.showerror("Erreur Audio", f"Une erreur inattendue est survenue pendant le décodage : {e}"))
         finally:
+            self.flush()
             self.stream = None
             self.decoding = False
+            if self.capture is not None:
+                self.capture.close()
+                logging.info(f"Raw capture saved to {self.capture.path}.")
             logging.info("Stream stopped.")
             if self.status_var: self.status_var.set("⏹️ Écoute arrêtée.")
             if self.on_stop:
@@ -127,39 +499,53 @@ class AudioDecoder(threading.Thread):
         self._stop_event.set()
         if self.status_var: self.status_var.set("... Arrêt en cours ...")
 
+    def emit(self, text):
+        """Ajoute du texte décodé à la transcription et à la zone de sortie (bornée)."""
+        self.transcript.append(text)
+        if self.output_widget and self.output_widget.winfo_exists():
+            self.output_widget.after(0, self._append_output, text)
+
+    def _append_output(self, text):
+        # Exécuté dans le thread Tkinter : la zone n'affiche que la fin de la transcription
+        self.output_widget.insert(tk.END, text)
+        self.output_widget.delete('1.0', f'end-{max_display_chars + 1}c')
+        self.output_widget.see(tk.END)
+
     def callback(self, indata, frames, time, status):
         """Fonction de rappel appelée par sounddevice pour traiter les chunks audio entrants."""
         if status:
             logging.warning(f"Stream callback status: {status}")
 
+        # La capture brute passe avant tout filtrage : le rejeu voit exactement ce qui est arrivé
+        if self.capture is not None:
+            self.capture.write(indata[:, 0] if indata.ndim > 1 else indata, 1 if status else 0)
+
+        if self.detector == 'run':
+            self.detect_run_block(indata[:, 0] if indata.ndim > 1 else indata)
+            return
+
         if not indata.any() or np.max(np.abs(indata)) < 1e-5:
              self.last_char = None
              self.consecutive_count = 0
              return
 
         mono_data = indata[:, 0] if indata.ndim > 1 else indata
-        freq = get_dominant_freq(mono_data, sample_rate)
+        freq = get_dominant_freq(mono_data, sample_rate, self.interpolate)
 
         if self.mode == 'text':
-            char = freq_to_char(freq)
+            char = freq_to_char(freq, self.base_freq)
             if char:
                 logging.debug(f"Detected frequency: {int(freq)} Hz -> Potential char '{char}'")
 
                 if char == self.last_char and char != ' ':
                     self.consecutive_count += 1
-                    if self.consecutive_count >= self.consecutive_threshold:
-                        if self.text_buffer and self.text_buffer[-1] != ' ':
-                             if self.output_widget and self.output_widget.winfo_exists():
-                                self.output_widget.after(0, self.output_widget.insert, tk.END, ' ')
-                                self.output_widget.after(0, self.output_widget.see, tk.END)
-                             self.text_buffer.append(' ')
+                    if self.consecutive_threshold and self.consecutive_count >= self.consecutive_threshold:
+                        if self.transcript and self.transcript.last_char() != ' ':
+                             self.emit(' ')
                              logging.info(f"Interpreted consecutive '{char}' as space.")
 
                 elif char != self.last_char:
-                    if self.output_widget and self.output_widget.winfo_exists():
-                        self.output_widget.after(0, self.output_widget.insert, tk.END, char)
-                        self.output_widget.after(0, self.output_widget.see, tk.END)
-                    self.text_buffer.append(char)
+                    self.emit(char)
                     self.last_char = char
                     self.consecutive_count = 1
 
@@ -172,27 +558,195 @@ class AudioDecoder(threading.Thread):
         elif self.mode == 'binary':
             bit = freq_to_bit(freq)
             if bit is not None:
-                self.bits_buffer.append(str(bit))
-                logging.debug(f"Detected bit: {bit}. Buffer: {''.join(self.bits_buffer)}")
-
-                if len(self.bits_buffer) >= 8:
-                    byte_str = ''.join(self.bits_buffer[:8])
-                    self.bits_buffer = self.bits_buffer[8:]
-
-                    try:
-                        val = int(byte_str, 2)
-                        logging.info(f"Byte received: {byte_str} -> {val:02X}")
-                        if self.output_widget and self.output_widget.winfo_exists():
-                            self.output_widget.after(0, self.output_widget.insert, tk.END, f"{val:02X} ")
-                            self.output_widget.after(0, self.output_widget.see, tk.END)
-                    except ValueError:
-                        logging.error(f"Error converting bit string '{byte_str}' to integer.")
-                        if self.output_widget and self.output_widget.winfo_exists():
-                            self.output_widget.after(0, self.output_widget.insert, tk.END, f"** Erreur: Conversion binaire '{byte_str}' ** ")
-                            self.output_widget.after(0, self.output_widget.see, tk.END)
+                val = self.bits.push(bit)
+                logging.debug(f"Detected bit: {bit}. Buffer: {self.bits.pending()}")
+
+                if val is not None:
+                    logging.info(f"Byte received: {val:08b} -> {val:02X}")
+                    self.emit(f"{val:02X} ")
             elif freq != 0:
                 logging.debug(f"Frequency {int(freq)} Hz does not map to a binary bit.")
 
+    def detect_run_block(self, mono_data):
+        """Détecteur "run" : analyse la fenêtre glissante qui se termine par ce bloc."""
+        # sounddevice réutilise son tampon : on garde une copie du bloc
+        self._window.append(np.array(mono_data, copy=True))
+        del self._window[:-self.window_chunks]
+        data = np.concatenate(self._window)
+        if len(self._window) < self.window_chunks or np.max(np.abs(data)) < 1e-5:
+            self.end_run(None)
+            return
+
+        freq = get_dominant_freq(data, sample_rate, self.interpolate)
+        symbol = freq_to_char(freq, self.base_freq) if self.mode == 'text' else freq_to_bit(freq)
+        if symbol == self.run_symbol:
+            self.run_length += 1
+        else:
+            self.end_run(symbol)
+
+    def end_run(self, next_symbol):
+        """Clôt la série en cours : les séries trop courtes (transitions) sont ignorées."""
+        if self.run_symbol is not None and self.run_length >= self.min_run:
+            repeats = max(1, int(round(self.run_length / self.chunks_per_symbol)))
+            logging.debug(f"Run of {self.run_length} blocks -> {repeats} x {self.run_symbol!r}")
+            for _ in range(repeats):
+                self.accept_symbol(self.run_symbol)
+        self.run_symbol = next_symbol
+        self.run_length = 1 if next_symbol is not None else 0
+
+    def accept_symbol(self, symbol):
+        if self.mode == 'text':
+            self.emit(symbol)
+            return
+        val = self.bits.push(symbol)
+        if val is not None:
+            logging.info(f"Byte received: {val:08b} -> {val:02X}")
+            self.emit(f"{val:02X} ")
+
+    def flush(self):
+        """Émet le dernier symbole encore en attente (détecteur "run")."""
+        if self.detector == 'run':
+            self.end_run(None)
+
+
+# Re-décodage hors ligne d'une capture brute, plus vite que le temps réel
+def replay_capture(path, mode='text', profile="Classique", base_freq=1000, start=None, end=None, transcript=None, **settings):
+    """Re-décode une fenêtre de la capture (secondes depuis son début) avec d'autres réglages que le direct."""
+    ring = CaptureRing.open(path)
+    try:
+        if ring.rate != sample_rate:
+            raise ValueError(f"Capture à {ring.rate} Hz, le décodeur attend {sample_rate} Hz.")
+        samples = ring.read(start, end)
+    finally:
+        ring.close()
+
+    decoder = AudioDecoder(mode, transcript=transcript, profile=profile, base_freq=base_freq, settings=settings)
+
+    # Les blocs sont redécoupés à la taille du profil choisi, sans attendre entre eux
+    started = time.perf_counter()
+    step = decoder.chunk_size
+    for i in range(0, len(samples) - step + 1, step):
+        decoder.callback(samples[i:i + step, np.newaxis], step, None, None)
+    decoder.flush()
+    elapsed = time.perf_counter() - started
+    audio_seconds = len(samples) / sample_rate
+    logging.info(f"Replayed {audio_seconds:.1f} s of captured audio in {elapsed:.2f} s "
+                 f"({audio_seconds / max(elapsed, 1e-9):.0f}x real time, mode '{mode}', profile '{profile}', base {base_freq} Hz).")
+    return decoder.transcript
+
+# Banc du décodeur en direct : chaque profil reçoit l'audio de sa forme d'onde par blocs, comme depuis le micro
+def bench_profiles(chars, snr_db, jitter_ms, seed):
+    """Plus courte durée par caractère décodée sans erreur par chaque profil, sur un canal bruité et décalé."""
+    rng = np.random.default_rng(seed)
+    text = ''.join(chr(c) for c in rng.integers(32, 127, size=chars))
+    freqs = text_to_freq(text, 1000)
+    noise_std = np.sqrt(0.4 ** 2 / 2 / 10 ** (snr_db / 10))
+    durations = [0.1, 0.05, 0.03, 0.025, 0.02, 0.015, 0.01]
+    print(f"Décodeur en direct (RSB {snr_db} dB, retard aléatoire jusqu'à {jitter_ms} ms, {chars} caractères aléatoires) :")
+    for profile in decoder_profiles:
+        best = None
+        for duration in durations:
+            try:
+                decoder = AudioDecoder('text', profile=profile, settings={"symbol_duration": duration})
+            except ValueError as e:
+                print(f"  {profile:15s} {duration * 1000:5.1f} ms : refusé ({e})")
+                break
+            snd = generators[profile](freqs, duration, sample_rate)
+            # Le bruit couvre aussi le retard : le décodeur ne voit jamais de silence parfait
+            delay = np.zeros(int(rng.uniform(0, jitter_ms / 1000) * sample_rate))
+            received = (np.concatenate([delay, snd]) + rng.normal(0, noise_std, len(delay) + len(snd))).astype(np.float32)
+            step = decoder.chunk_size
+            for i in range(0, len(received) - step + 1, step):
+                decoder.callback(received[i:i + step, np.newaxis], step, None, None)
+            decoder.flush()
+            decoded = decoder.transcript.read()
+            decoder.transcript.close()
+            # Caractères perdus, ajoutés ou faux : un décalage ne compte qu'une fois
+            matched = sum(block.size for block in difflib.SequenceMatcher(None, decoded, text, autojunk=False).get_matching_blocks())
+            errors = max(len(decoded), len(text)) - matched
+            print(f"  {profile:15s} {duration * 1000:5.1f} ms : {errors:4d} erreurs / {chars}, {1 / duration:6.1f} car/s")
+            if errors:
+                break # Plus courte durée sans erreur : toutes les durées plus longues le sont aussi
+            best = duration
+        if best:
+            print(f"  -> {profile} : plus courte durée sans erreur {best * 1000:.1f} ms ({1 / best:.1f} car/s)")
+        else:
+            print(f"  -> {profile} : aucune durée testée sans erreur")
+
+# ---- Index de recherche des WAV (fichier compagnon .lyxidx, même format que Lyrivox-S) ----
+
+def load_wav(path):
+    """Ouvre un WAV sans le charger : les échantillons restent mappés depuis le disque."""
+    rate, data = wavfile.read(path, mmap=True)
+    if data.ndim > 1:
+        data = data[:, 0]
+    return rate, data
+
+def build_wav_index(wav_path, waveform="Classique", duration=0.1, base_freq=1000, block_chars=index_block_chars):
+    """Construit l'index d'un WAV en le décodant entièrement (même format que celui écrit par Lyrivox-S)."""
+    rate, data = load_wav(wav_path)
+    bounds = symbol_offsets(symbol_count(len(data), duration, waveform, rate), duration, waveform, rate)
+    text = decode_symbols(data, bounds, rate, waveform, duration, base_freq)
+    index = make_index(text, data, bounds, rate, waveform, duration, base_freq, block_chars)
+    logging.info(f"Built index for {wav_path}: {index['chars']} symbols in {len(index['blocks'])} blocks.")
+    return index
+
+def open_wav_index(wav_path, waveform="Classique", duration=0.1, base_freq=1000, rebuild=False):
+    """Charge l'index compagnon du WAV, ou le construit (et l'écrit) s'il n'existe pas encore."""
+    path = index_path(wav_path)
+    if os.path.exists(path) and not rebuild:
+        return load_index(path)
+    index = build_wav_index(wav_path, waveform, duration, base_freq)
+    write_index(path, index)
+    return index
+
+def index_text(index):
+    return ''.join(block["text"] for block in index["blocks"])
+
+def sample_offsets(index, first, last):
+    """Bornes en échantillons des caractères first..last, à partir de l'ancre du bloc de first."""
+    block = index["blocks"][min(first // index["block_chars"], len(index["blocks"]) - 1)]
+    grid = symbol_offsets(last - first, index["duration"], index["waveform"], index["rate"], first)
+    anchor = symbol_offsets(0, index["duration"], index["waveform"], index["rate"], block["char"])[0]
+    return block["sample"] + grid - anchor
+
+def decode_wav_range(wav_path, index, first, last):
+    """Décode les caractères first..last-1 en ne lisant que leurs échantillons : O(longueur de la plage)."""
+    first, last = max(0, first), min(index["chars"], last)
+    if first >= last:
+        return ""
+    rate, data = load_wav(wav_path)
+    bounds = sample_offsets(index, first, last)
+    return decode_symbols(data, bounds, rate, index["waveform"], index["duration"], index["base_freq"])
+
+def search_index(index, query):
+    """Positions (caractère, seconde) de chaque occurrence de query dans la transcription indexée."""
+    text = index_text(index)
+    matches = []
+    position = text.find(query)
+    while query and position >= 0:
+        matches.append((position, int(sample_offsets(index, position, position)[0]) / index["rate"]))
+        position = text.find(query, position + 1)
+    return matches
+
+def verify_index(wav_path, index, block_numbers=None):
+    """Recalcule les CRC audio et texte des blocs demandés (tous par défaut) et les compare à l'index."""
+    rate, data = load_wav(wav_path)
+    numbers = range(len(index["blocks"])) if block_numbers is None else block_numbers
+    results = []
+    for number in numbers:
+        block = index["blocks"][number]
+        start = block["sample"]
+        audio = np.ascontiguousarray(data[start:start + block["samples"]])
+        bounds = sample_offsets(index, block["char"], block["char"] + len(block["text"]))
+        text = decode_symbols(data, bounds, rate, index["waveform"], index["duration"], index["base_freq"])
+        results.append({
+            "block": number,
+            "char": block["char"],
+            "audio_ok": zlib.crc32(audio.tobytes()) == block["audio_crc"],
+            "text_ok": zlib.crc32(text.encode('utf-8')) == block["text_crc"],
+        })
+    return results
 
 # Interface Graphique Tkinter pour le Décodeur
 class App:
@@ -265,6 +819,21 @@ class App:
         self.mode_cb.current(0)
         self.mode_cb.pack(fill="x")
 
+        # Forme d'onde attendue : choisit le profil de décodage adapté au générateur
+        ttk.Label(mode_frame, text="Forme d'onde :").pack(anchor="w", pady=(5, 5))
+        self.profile_cb = ttk.Combobox(mode_frame, values=list(decoder_profiles), state='readonly', width=15, font=("Segoe UI", 10))
+        self.profile_cb.current(0)
+        self.profile_cb.pack(fill="x")
+        self.profile_cb.bind("<<ComboboxSelected>>", self.on_profile_selected)
+
+        # Durée par caractère : doit être celle réglée dans le générateur (le découpage en blocs en dépend)
+        duration_frame = ttk.Frame(mode_frame)
+        duration_frame.pack(fill="x", pady=(5, 0))
+        ttk.Label(duration_frame, text="Durée par caractère (s) :").pack(side="left", padx=(0, 5))
+        self.duration_entry = tk.Entry(duration_frame, width=10, **entry_style_options)
+        self.duration_entry.insert(0, str(decoder_profiles[self.profile_cb.get()]["symbol_duration"]))
+        self.duration_entry.pack(side="left", fill="x", expand=True)
+
         # Sélection de la Transformation (à droite, comme la configuration durée dans le générateur)
         transform_frame = ttk.Frame(options_frame)
         transform_frame.pack(side="left", fill="x", expand=True, padx=(10, 0))
@@ -273,6 +842,12 @@ class App:
         self.transform_cb.current(0)
         self.transform_cb.pack(fill="x")
 
+        # Capture brute : l'audio reçu reste rejouable avec d'autres réglages
+        style.configure("TCheckbutton", background="#333333", foreground="#f0f0f0", font=("Segoe UI", 10))
+        self.capture_var = tk.BooleanVar(value=False)
+        self.capture_check = ttk.Checkbutton(transform_frame, text="Capture brute (rejouable)", variable=self.capture_var)
+        self.capture_check.pack(anchor="w", pady=(5, 0))
+
         # Label de statut (copié pour cohérence)
         self.status_var = tk.StringVar()
         self.status_label = ttk.Label(frm, textvariable=self.status_var, font=("Segoe UI", 9))
@@ -290,10 +865,43 @@ class App:
         self.btn_stop.pack(side='left', fill='x', expand=True, padx=(5, 5))
 
         self.btn_clear = ttk.Button(button_frame, text="✕ Effacer", command=self.clear_output, style="TButton")
-        self.btn_clear.pack(side='left', fill='x', expand=True, padx=(5, 0))
+        self.btn_clear.pack(side='left', fill='x', expand=True, padx=(5, 5))
+
+        self.btn_export = ttk.Button(button_frame, text="💾 Exporter", command=self.export_transcript, style="TButton")
+        self.btn_export.pack(side='left', fill='x', expand=True, padx=(5, 5))
+
+        self.btn_replay = ttk.Button(button_frame, text="⟲ Rejouer", command=self.replay_capture_file, style="TButton")
+        self.btn_replay.pack(side='left', fill='x', expand=True, padx=(5, 0))
 
         self.decoder_thread = None
         self.decoder = None
+        # Transcription de la dernière session (gardée après l'arrêt pour le post-traitement et l'export)
+        self.transcript = None
+        self.transformed = None # Résultat de la transformation post-écoute, sur disque comme la transcription
+        self.last_capture_path = None
+
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_profile_selected(self, event=None):
+        """Remet la durée par caractère à la valeur par défaut de la forme d'onde choisie."""
+        self.duration_entry.delete(0, tk.END)
+        self.duration_entry.insert(0, str(decoder_profiles[self.profile_cb.get()]["symbol_duration"]))
+
+    def read_decoder_settings(self):
+        """Réglages saisis (durée par caractère), ou None après avoir signalé une valeur invalide."""
+        profile = self.profile_cb.get()
+        try:
+            symbol_duration = float(self.duration_entry.get())
+            if not symbol_duration > 0:
+                raise ValueError("la durée doit être positive")
+            chunk_size = decoder_chunk_size(profile, {"symbol_duration": symbol_duration})
+            if chunk_size < min_chunk_size:
+                raise ValueError(f"blocs de {chunk_size} échantillons, minimum {min_chunk_size}")
+        except ValueError as e:
+            self.status_var.set("❗ Durée par caractère invalide.")
+            messagebox.showerror("Durée invalide", f"Entrez la durée par caractère utilisée par le générateur (en secondes).\n\nDétails : {e}")
+            return None
+        return {"symbol_duration": symbol_duration}
 
     def clear_output(self, event=None):
         """Efface le contenu de la zone de sortie."""
@@ -302,27 +910,93 @@ class App:
              return
 
         self.text_output.delete('1.0', tk.END)
+        if self.transcript is not None:
+            self.transcript.close()
+        if self.transformed is not None:
+            self.transformed.close()
+        self.transcript = None
+        self.transformed = None
         if self.status_var: self.status_var.set("")
         logging.info("Output cleared.")
 
+    def export_transcript(self):
+        """Enregistre la transcription complète (mémoire et disque) dans un fichier texte,
+        et le résultat de la transformation à côté s'il y en a un."""
+        if self.transcript is None or not self.transcript:
+            messagebox.showinfo("Export", "Aucune transcription à exporter.")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Texte", "*.txt"), ("Tous les fichiers", "*.*")])
+        if not path:
+            return
+        try:
+            self.transcript.export(path)
+            logging.info(f"Transcript exported to {path} ({len(self.transcript)} chars).")
+            message = f"💾 Transcription exportée : {path}"
+            if self.transformed is not None:
+                root, ext = os.path.splitext(path)
+                transformed_path = f"{root}_{self.transform_cb.get()}{ext}"
+                self.transformed.export(transformed_path)
+                logging.info(f"Transformed transcript exported to {transformed_path} ({len(self.transformed)} chars).")
+                message += f" (transformée : {transformed_path})"
+            self.status_var.set(message)
+        except (OSError, ValueError) as e:
+            logging.error(f"Transcript export failed: {e}", exc_info=True)
+            messagebox.showerror("Erreur d'export", f"Impossible d'écrire le fichier : {e}")
+
+    def on_close(self):
+        """Arrête le décodeur et supprime le fichier de transcription avant de fermer."""
+        if self.decoder and self.decoder.is_alive():
+            self.decoder.stop()
+            self.decoder.join(timeout=1)
+        if self.transcript is not None:
+            self.transcript.close()
+        if self.transformed is not None:
+            self.transformed.close()
+        self.root.destroy()
+
     def start_decoder(self):
         """Démarre le processus de décodage audio dans un thread séparé."""
         if self.decoder_thread and self.decoder_thread.is_alive():
             tk.messagebox.showwarning("En cours", "Un décodage est déjà en cours.")
             return
 
+        settings = self.read_decoder_settings()
+        if settings is None:
+            return
+
+        capture = None
+        if self.capture_var.get():
+            capture_path = time.strftime(capture_path_pattern)
+            try:
+                # Emplacements à la taille des blocs du profil : l'anneau garde bien capture_seconds de son
+                capture = CaptureRing.create(capture_path, capture_seconds, decoder_chunk_size(self.profile_cb.get(), settings))
+                self.last_capture_path = capture_path
+            except OSError as e:
+                logging.error(f"Could not create raw capture file {capture_path}: {e}", exc_info=True)
+                messagebox.showerror("Erreur de capture", f"Impossible de créer le fichier de capture : {e}")
+                return
+
         self.clear_output()
         mode = 'text' if self.mode_cb.get() == 'Texte' else 'binary'
         self.btn_start.config(state=tk.DISABLED)
+        self.btn_replay.config(state=tk.DISABLED)
+        self.capture_check.config(state=tk.DISABLED)
         self.btn_stop.config(state=tk.NORMAL)
         self.mode_cb.config(state=tk.DISABLED)
+        self.profile_cb.config(state=tk.DISABLED)
+        self.duration_entry.config(state=tk.DISABLED)
         self.transform_cb.config(state=tk.DISABLED)
 
+        self.transcript = TranscriptStore()
         self.decoder = AudioDecoder(
             mode,
             output_widget=self.text_output, # self.text_output est le ScrolledText
             on_stop=self.on_decoder_stopped,
-            status_var=self.status_var
+            status_var=self.status_var,
+            transcript=self.transcript,
+            profile=self.profile_cb.get(),
+            capture=capture,
+            settings=settings
         )
         self.decoder_thread = self.decoder
         self.decoder_thread.start()
@@ -344,108 +1018,183 @@ class App:
         self.decoder = None
         self.btn_start.config(state=tk.NORMAL)
         self.btn_stop.config(state=tk.DISABLED)
+        self.btn_replay.config(state=tk.NORMAL)
+        self.capture_check.config(state=tk.NORMAL)
         self.mode_cb.config(state='readonly')
+        self.profile_cb.config(state='readonly')
+        self.duration_entry.config(state=tk.NORMAL)
         self.transform_cb.config(state='readonly')
         self.post_process_output()
 
+    def replay_capture_file(self):
+        """Re-décode une capture brute avec le mode et la forme d'onde sélectionnés."""
+        if self.decoder and self.decoder.decoding:
+            messagebox.showwarning("En cours", "Arrêtez l'écoute avant de rejouer une capture.")
+            return
+        path = filedialog.askopenfilename(initialfile=self.last_capture_path or "", filetypes=[("Capture Lyrivox", "*.lyrcap"), ("Tous les fichiers", "*.*")])
+        if not path:
+            return
+
+        mode = 'text' if self.mode_cb.get() == 'Texte' else 'binary'
+        profile = self.profile_cb.get()
+        settings = self.read_decoder_settings()
+        if settings is None:
+            return
+        self.clear_output()
+        self.btn_start.config(state=tk.DISABLED)
+        self.btn_replay.config(state=tk.DISABLED)
+        self.status_var.set(f"⟲ Rejeu de la capture {os.path.basename(path)}...")
+
+        def worker():
+            transcript = TranscriptStore()
+            error = None
+            try:
+                replay_capture(path, mode=mode, profile=profile, transcript=transcript, **settings)
+            except Exception as e:
+                logging.error(f"Replay of {path} failed: {e}", exc_info=True)
+                error = e
+            self.root.after(0, self.on_replay_done, path, transcript, error)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_replay_done(self, path, transcript, error):
+        """Affiche le résultat du rejeu (thread Tkinter) ; post-traitement et export lisent la même transcription."""
+        self.btn_start.config(state=tk.NORMAL)
+        self.btn_replay.config(state=tk.NORMAL)
+        if error is not None:
+            transcript.close()
+            self.status_var.set(f"❌ Rejeu impossible : {error}")
+            messagebox.showerror("Erreur de rejeu", f"Impossible de rejouer {path} : {error}")
+            return
+
+        self.transcript = transcript
+        self.text_output.insert(tk.END, transcript.tail(max_display_chars))
+        self.text_output.see(tk.END)
+        self.status_var.set(f"✅ Capture rejouée : {len(transcript)} caractères décodés.")
+        self.post_process_output()
+
     def post_process_output(self):
-        """Applique une transformation (comme ROT13, Inverser, Base64) au texte décodé affiché."""
+        """Applique une transformation (comme ROT13, Inverser, Base64) à la transcription décodée.
+        Le résultat est écrit en flux dans un second TranscriptStore ; seule sa fin est affichée."""
         transform = self.transform_cb.get()
-        content = self.text_output.get('1.0', tk.END).strip()
-
-        decoded_post = content # Initialise avec le contenu original
+        if self.transformed is not None:
+            self.transformed.close()
+            self.transformed = None
+        # Comme avant : rien à faire sans transformation ou si la transcription ne contient que des espaces
+        if transform == "Aucun" or self.transcript is None or not any(strip_chunks(self.transcript.iter_chunks())):
+            return
 
-        if transform == 'ROT13' and content:
+        out = TranscriptStore()
+        note = None
+        if transform == 'ROT13':
              logging.info("Applying ROT13 post-processing.")
-             decoded_post = content.translate(str.maketrans(
-                 "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
-                 "NOPQRSTUVWXYZABCDEFGHIJKLMnopqrstuvwxyzabcdefghijklm"
-             ))
-        elif transform == 'Inverser' and content:
+             for chunk in strip_chunks(self.transcript.iter_chunks()):
+                 out.append(encode_rot13(chunk))
+        elif transform == 'Inverser':
              logging.info("Applying Reverse post-processing.")
-             decoded_post = encode_reverse(content)
-        elif transform == 'Base64' and content:
+             for chunk in strip_chunks(self.transcript.iter_reversed()):
+                 out.append(chunk)
+        elif transform == 'Base64':
              logging.info("Applying Base64 post-processing.")
              # Base64 decoding is sensitive to input exactness.
              # Errors here often mean the string captured from audio is corrupted.
+             note = base64_decode_chunks(strip_chunks(self.transcript.iter_chunks()), out)
+
+        # On affiche le résultat transformé si c'est différent de l'original OU si c'est le résultat Base64 (succès, partiel ou erreur)
+        if transform != 'Base64' and same_chunks(out.iter_chunks(), strip_chunks(self.transcript.iter_chunks())):
+            out.close()
+            return
 
-             decoded_post = f"ERREUR: Impossible de décoder Base64 depuis l'audio." # Message d'erreur par défaut
-
-             # --- Nettoyage de l'entrée ---
-             valid_base64_chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
-             cleaned_content = "".join(c for c in content if c in valid_base64_chars)
-             logging.debug(f"Original Base64 input length: {len(content)}, cleaned length: {len(cleaned_content)}. Cleaned content start: {cleaned_content[:50]}...")
-             # -----------------------------
-
-             if not cleaned_content:
-                 decoded_post = "ERREUR_DECODAGE_BASE64: L'entrée capturée ne contient aucun caractère Base64 valide."
-                 logging.warning(decoded_post)
-             else:
-                 # --- Tentative 1: Décodage standard avec padding ---
-                 try:
-                     logging.debug("Attempting standard Base64 decode with padding.")
-                     # Calculer le padding nécessaire pour que la longueur soit un multiple de 4
-                     padding_needed = (4 - len(cleaned_content) % 4) % 4
-                     content_padded = cleaned_content + '=' * padding_needed
-                     logging.debug(f"Cleaned Base64 content length: {len(cleaned_content)}, padded length: {len(content_padded)}. Padded content start: {content_padded[:50]}...")
-
-                     # Tenter le décodage Base64 standard
-                     decoded_bytes = base64.b64decode(content_padded)
-                     decoded_post = decoded_bytes.decode('utf-8', errors='replace')
-                     logging.info("Base64 standard decoding successful.")
-
-                 # --- Tentative 2: Gérer l'erreur standard (le plus souvent binascii.Error) et essayer une récupération partielle ---
-                 except binascii.Error as e:
-                     logging.error(f"BinASCII error during standard Base64 decode (after cleaning/padding): {e}. Trying partial decode.", exc_info=True)
-                     error_message_standard = f"ERREUR_BASE64 (Format/Padding): {e}"
-                     decoded_post = f"{error_message_standard}\n(La chaîne capturée, même nettoyée et paddée, n'est pas du Base64 valide.)" # Message par défaut si la récupération échoue
-
-                     # --- Tentative 2.1: Décodage tronqué ---
-                     try:
-                         logging.debug("Attempting truncated Base64 decode.")
-                         # Calculer la plus grande longueur multiple de 4 inférieure ou égale à la longueur nettoyée
-                         truncated_length = len(cleaned_content) // 4 * 4
-                         if truncated_length > 0:
-                             truncated_content = cleaned_content[:truncated_length]
-                             logging.debug(f"Decoding truncated content (length {truncated_length}): {truncated_content[:50]}...")
-                             # Décodage de la partie tronquée (aucune padding supplémentaire n'est nécessaire ici)
-                             decoded_bytes_truncated = base64.b64decode(truncated_content)
-                             decoded_post = decoded_bytes_truncated.decode('utf-8', errors='replace')
-                             logging.warning(f"Base64 partial decode successful (truncated to {truncated_length} chars).")
-                             # Ajouter une note pour l'utilisateur que c'est un résultat partiel/spéculatif
-                             decoded_post += f"\n\n(ATTENTION: Décodage partiel réussi à partir des {truncated_length} premiers caractères. Le reste a été ignoré.)" # Message plus précis
-                         else:
-                              # Si la longueur nettoyée est < 4, on ne peut pas tronquer utilement
-                              logging.warning("Cleaned content length < 4. Cannot attempt truncated decode.")
-                              decoded_post = f"{error_message_standard}\n(La chaîne nettoyée est trop courte (<4) pour un décodage Base64, même partiel.)"
-
-
-                     except binascii.Error as e_truncated:
-                          logging.error(f"BinASCII error during truncated Base64 decode: {e_truncated}", exc_info=True)
-                          decoded_post = f"{error_message_standard}\n(La tentative de décodage partiel a échoué aussi : {e_truncated})" # Message mis à jour
-
-                     except Exception as e_truncated_general:
-                          logging.error(f"General error during truncated Base64 decode: {e_truncated_general}", exc_info=True)
-                          decoded_post = f"{error_message_standard}\n(La tentative de décodage partiel a échoué avec une erreur générale : {e_truncated_general})"
-
-                 # --- Gérer les autres exceptions générales pour le décodage standard (moins probable après nettoyage/troncature) ---
-                 except Exception as e:
-                     logging.error(f"General error during standard Base64 decode (after cleaning): {e}", exc_info=True)
-                     decoded_post = f"ERREUR_DECODAGE_BASE64 (Erreur Générale Inattendue): {e}"
-
-
-        # Ajoute le bloc de résultat transformé si la transformation n'était pas "Aucun" et qu'il y a du contenu original
-        # On affiche toujours le résultat du décodage Base64 s'il y avait du contenu initial, même si c'est une erreur ou un résultat partiel.
-        if transform != "Aucun" and content:
-             # On affiche le résultat transformé si c'est différent de l'original OU si c'est le résultat Base64 (succès, partiel ou erreur)
-             # Correction: Utiliser self.text_output pour insert et see
-             if decoded_post != content or transform == 'Base64':
-                 self.text_output.insert(tk.END, f"\n\n=== Transformé ({transform}) ===\n{decoded_post}")
-                 self.text_output.see(tk.END)
+        self.transformed = out
+        shown = out.tail(max_display_chars)
+        skipped = f"(... {len(out) - len(shown)} caractères précédents : voir l'export)\n" if len(out) > len(shown) else ""
+        self.text_output.insert(tk.END, f"\n\n=== Transformé ({transform}) ===\n{skipped}{shown}{note or ''}")
+        self.text_output.see(tk.END)
 
 
 # Point d'entrée principal du script : crée la fenêtre Tkinter et lance l'application
 if __name__ == '__main__':
-    root = tk.Tk()
-    app = App(root)
-    root.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Décodeur Lyrivox. Sans --replay, --wav ni --bench, ouvre l'interface graphique.")
+    parser.add_argument("--replay", metavar="CAPTURE", help="Re-décode hors ligne une capture brute et affiche le résultat.")
+    parser.add_argument("--wav", metavar="WAV", help="Décode un WAV de Lyrivox-S via son index .lyxidx (construit s'il manque).")
+    parser.add_argument("--build-index", action="store_true", help="Avec --wav : reconstruit l'index depuis l'audio.")
+    parser.add_argument("--range", metavar="DEBUT:FIN", help="Avec --wav : décode seulement les caractères DEBUT à FIN-1.")
+    parser.add_argument("--search", metavar="TEXTE", help="Avec --wav : cherche TEXTE dans la transcription indexée.")
+    parser.add_argument("--verify", metavar="BLOC", type=int, nargs="*", help="Avec --wav : vérifie les blocs (tous si aucun numéro).")
+    parser.add_argument("--mode", choices=["text", "binary"], default="text")
+    parser.add_argument("--profile", choices=list(decoder_profiles), default="Classique")
+    parser.add_argument("--base-freq", type=float, default=1000)
+    parser.add_argument("--detector", choices=["block", "run"], default=None, help="Remplace le détecteur du profil.")
+    parser.add_argument("--symbol-duration", type=float, default=None, help="Durée d'un symbole à l'émission (s), si différente du profil.")
+    parser.add_argument("--consecutive-threshold", type=int, default=None, help="Répétitions interprétées comme un espace (0 désactive).")
+    parser.add_argument("--interpolate", action=argparse.BooleanOptionalAction, default=None, help="Force l'interpolation de fréquence.")
+    parser.add_argument("--start", type=float, default=None, help="Début de la fenêtre (s depuis le début de la capture).")
+    parser.add_argument("--end", type=float, default=None, help="Fin de la fenêtre (s depuis le début de la capture).")
+    parser.add_argument("--bench", action="store_true", help="Compare les profils du décodeur en direct sur un canal simulé.")
+    parser.add_argument("--chars", type=int, default=300, help="Avec --bench : longueur du texte aléatoire.")
+    parser.add_argument("--snr", type=float, default=20.0, help="Avec --bench : rapport signal/bruit (dB).")
+    parser.add_argument("--jitter-ms", type=float, default=2.0, help="Avec --bench : retard aléatoire maximal (ms).")
+    parser.add_argument("--seed", type=int, default=1, help="Avec --bench : graine du texte et du bruit.")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench_profiles(args.chars, args.snr, args.jitter_ms, args.seed)
+    elif args.wav:
+        duration = args.symbol_duration or decoder_profiles[args.profile]["symbol_duration"]
+        try:
+            index = open_wav_index(args.wav, args.profile, duration, args.base_freq, rebuild=args.build_index)
+        except (OSError, ValueError) as e:
+            parser.error(f"--wav {args.wav} : {e}")
+        if args.range:
+            first, sep, last = args.range.partition(":")
+            try:
+                first, last = int(first or 0), int(last) if last else index["chars"]
+            except ValueError:
+                sep = ""
+            if not sep:
+                parser.error(f"--range attend DEBUT:FIN (entiers, l'un ou l'autre facultatif), reçu '{args.range}'.")
+            if not 0 <= first <= last <= index["chars"]:
+                parser.error(f"--range {args.range} : il faut 0 <= DEBUT <= FIN <= {index['chars']} (caractères indexés).")
+            print(decode_wav_range(args.wav, index, first, last))
+        elif args.search is not None:
+            if not args.search:
+                parser.error("--search attend un texte non vide.")
+            for position, seconds in search_index(index, args.search):
+                print(f"{position}\t{seconds:.3f} s")
+        elif args.verify is not None:
+            missing = [number for number in args.verify if not 0 <= number < len(index["blocks"])]
+            if missing:
+                parser.error(f"--verify : bloc(s) {', '.join(map(str, missing))} inexistant(s), "
+                             f"l'index compte {len(index['blocks'])} bloc(s) numérotés à partir de 0.")
+            results = verify_index(args.wav, index, args.verify or None)
+            for result in results:
+                state = "OK" if result["audio_ok"] and result["text_ok"] else "ÉCHEC"
+                print(f"bloc {result['block']} (car. {result['char']}) : audio {'ok' if result['audio_ok'] else 'différent'}, "
+                      f"texte {'ok' if result['text_ok'] else 'différent'} -> {state}")
+        else:
+            print(index_text(index))
+    elif args.replay:
+        overrides = {}
+        if args.detector is not None and args.detector != decoder_profiles[args.profile]["detector"]:
+            # Le détecteur apporte son découpage : on reprend celui du profil qui l'utilise par défaut
+            reference = next(p for p in decoder_profiles.values() if p["detector"] == args.detector)
+            overrides.update({k: reference[k] for k in ("detector", "symbol_duration", "window_chunks", "chunks_per_symbol", "min_run")})
+        if args.symbol_duration is not None:
+            overrides["symbol_duration"] = args.symbol_duration
+        if args.consecutive_threshold is not None:
+            overrides["consecutive_threshold"] = args.consecutive_threshold or None # 0 désactive la règle
+        if args.interpolate is not None:
+            overrides["interpolate"] = args.interpolate
+        try:
+            transcript = replay_capture(args.replay, mode=args.mode, profile=args.profile, base_freq=args.base_freq,
+                                        start=args.start, end=args.end, **overrides)
+        except (OSError, ValueError) as e:
+            parser.error(f"--replay {args.replay} : {e}")
+        for chunk in transcript.iter_chunks():
+            print(chunk, end="")
+        print()
+        transcript.close()
+    else:
+        root = tk.Tk()
+        app = App(root)
+        root.mainloop()
\ No newline at end of file
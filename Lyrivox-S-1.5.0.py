@@ -6,33 +6,16 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.scrolledtext import ScrolledText
 import threading
+import itertools
 import subprocess
 import traceback
-import base64 # Import du module base64
+from collections import OrderedDict
 
-# ---- Fonctions d'encodage ----
-
-def encode_rot13(text):
-    """Applique l'encodage ROT13 au texte."""
-    return text.translate(str.maketrans(
-        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
-        "NOPQRSTUVWXYZABCDEFGHIJKLMnopqrstuvwxyzabcdefghijklm"
-    ))
-
-def encode_reverse(text):
-    """Inverse simplement la chaîne."""
-    return text[::-1]
-
-def encode_base64(text):
-    """Encode le texte en Base64."""
-    try:
-        # Base64 opère sur des octets, donc on encode d'abord la chaîne en bytes (UTF-8 est courant)
-        encoded_bytes = base64.b64encode(text.encode('utf-8'))
-        # Decode les bytes résultants en chaîne ASCII
-        return encoded_bytes.decode('ascii')
-    except Exception as e:
-        logging.error(f"Erreur lors de l'encodage Base64 : {e}")
-        return f"ERREUR_BASE64:{e}" # Signale une erreur d'encodage
+# Encodages, synthèse et grille des symboles : module partagé avec Lyrivox-LST et Lyrivox-SRV
+from lyrivox_signal import (
+    encode_rot13, encode_reverse, encode_base64, text_to_freq, decodable_text, generate_tone, iter_tone_continuous,
+    symbol_offsets, make_index, write_index, index_path, default_durations,
+)
 
 # ---- Mappage Fréquence & Génération Son ----
 
@@ -42,97 +25,165 @@ def encode_base64(text):
 # Pour que le décodage fonctionne avec d'autres encodages, il faudrait un accord sur la base_freq
 # ou l'inclure dans le signal ou un en-tête.
 
-def text_to_freq(text, base_freq):
-    """Convertit chaque caractère d'un texte en une fréquence basée sur une fréquence de base."""
-    # Mappage simple : fréquence de base + valeur ord * 10
-    return [base_freq + ord(c)*10 for c in text]
-
-def generate_tone(freqs, duration, rate=44100):
-    """Génère une séquence de tons WAV à partir d'une liste de fréquences."""
-    if duration <= 0:
-         return np.array([])
-
-    note_duration_factor = 0.9
-    silence_duration_factor = 1 - note_duration_factor
-
-    note_duration = duration * note_duration_factor
-    silence_duration = duration * silence_duration_factor
-
-    all_samples = []
-
-    samples_per_silence = int(rate * silence_duration)
-    silence_segment = np.zeros(samples_per_silence)
-
-    samples_per_note = int(rate * note_duration)
-    t_note = np.linspace(0, note_duration, samples_per_note, endpoint=False) if samples_per_note > 0 else np.array([])
-
-
-    for f in freqs:
-        if samples_per_note > 0:
-            tone = 0.4 * np.sin(2 * np.pi * f * t_note)
-            all_samples.append(tone)
-
-        if samples_per_silence > 0:
-            all_samples.append(silence_segment)
-
-    if not all_samples:
+def render_tone(freqs, duration, waveform, cancelled=None, progress=None, block_symbols=256):
+    """Génère le son par blocs de symboles. Renvoie None si cancelled est levé en cours de route."""
+    if waveform == "Phase continue":
+        blocks = iter_tone_continuous(freqs, duration, block_symbols=block_symbols)
+    else:
+        blocks = (generate_tone(freqs[i:i + block_symbols], duration) for i in range(0, len(freqs), block_symbols))
+
+    parts = []
+    done = 0
+    for block in blocks:
+        if cancelled is not None and cancelled.is_set():
+            return None
+        parts.append(block)
+        done = min(len(freqs), done + block_symbols)
+        if progress:
+            progress(done, len(freqs))
+
+    if not parts:
         return np.array([])
+    return np.concatenate(parts)
+
+
+# ---- Index de recherche (fichier compagnon .lyxidx) ----
+
+def build_index(text, data, duration, waveform, base_freq, rate=44100):
+    """Index du WAV généré : la grille des symboles est connue, le WAV n'est pas relu.
+    text est celui que le décodeur restitue (decodable_text), pour que la vérification le retrouve."""
+    bounds = symbol_offsets(len(text), duration, waveform, rate)
+    return make_index(text, data.astype('<i2', copy=False), bounds, rate, waveform, duration, base_freq)
+
+
+# ---- Ordonnanceur des générations ----
+
+class GenerationJob:
+    """Une demande de génération : paramètres figés au moment du clic et drapeau d'annulation."""
+    _ids = itertools.count(1)
+
+    def __init__(self, text, choice, waveform, base_freq, note_duration, with_index=False):
+        self.id = next(GenerationJob._ids)
+        self.text = text
+        self.choice = choice
+        self.waveform = waveform
+        self.base_freq = base_freq
+        self.note_duration = note_duration
+        self.with_index = with_index
+        self.key = (text, choice, waveform, base_freq, note_duration, with_index)
+        self.cancelled = threading.Event()
+
+class GenerationScheduler:
+    """File d'attente bornée servie par un petit pool de threads, avec annulation coopérative."""
+
+    def __init__(self, handler, workers=2, max_pending=4):
+        self.handler = handler
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = OrderedDict() # clé -> job, dans l'ordre d'arrivée
+        self._running = set()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"generation-{i}", daemon=True).start()
+
+    def submit(self, job):
+        """Met un job en file. Renvoie "queued", "coalesced" (doublon déjà en attente) ou "full"."""
+        with self._lock:
+            if job.key in self._pending:
+                return "coalesced"
+            if len(self._pending) >= self.max_pending:
+                return "full"
+            self._pending[job.key] = job
+            self._wakeup.notify()
+            return "queued"
+
+    def cancel_all(self):
+        """Vide la file et demande l'arrêt des générations en cours. Renvoie le nombre de jobs annulés."""
+        with self._lock:
+            jobs = list(self._pending.values()) + list(self._running)
+            self._pending.clear()
+        for job in jobs:
+            job.cancelled.set()
+        return len(jobs)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                _, job = self._pending.popitem(last=False)
+                self._running.add(job)
+            try:
+                self.handler(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job)
+
+# Un verrou par fichier de sortie : un WAV et son index sont remplacés ensemble, jamais entrelacés avec un autre job
+_output_locks = {}
+_output_locks_guard = threading.Lock()
+
+def output_lock(fn):
+    with _output_locks_guard:
+        return _output_locks.setdefault(fn, threading.Lock())
+
+
+def ui(func, *args):
+    """Exécute func dans le thread Tkinter : les widgets ne doivent pas être touchés depuis les workers."""
+    root.after(0, func, *args)
+
+def show_freqs(lines):
+    freq_box.config(state="normal")
+    freq_box.delete("1.0", "end")
+    freq_box.insert("end", "".join(lines))
+    freq_box.config(state="disabled")
 
-    return np.concatenate(all_samples)
-
-
-def play_sound():
-    """Génère le son basé sur le texte et les paramètres, écrit un fichier WAV et le joue."""
-    status_var.set("...")
+def generate_job(job):
+    """Génère le son d'un job, écrit un fichier WAV et le joue. Exécuté par un worker de l'ordonnanceur."""
+    tag = f"[#{job.id}]"
     try:
-        # 1) Récupère le texte et les configurations
-        status_var.set("💬 Récupération du texte et des paramètres...")
-        text = text_entry.get("1.0", "end").strip()
-        if not text:
-            status_var.set("❗ Entrez du texte !")
-            return
-
-        try:
-            # Récupère la fréquence de base et la durée (configurables dans cette version du générateur)
-            base_freq = float(base_freq_entry.get())
-            note_duration = float(duration_entry.get())
-            if base_freq <= 0 or note_duration <= 0:
-                 status_var.set("❗ Fréquence de base et durée doivent être positives.")
-                 return
-        except ValueError:
-            status_var.set("❗ Veuillez entrer des nombres valides pour la fréquence et la durée.")
-            return
-
-
-        # 2) Encodage
-        status_var.set("🔐 Application de l'encodage...")
-        choice = encoding_cb.get()
+        # 1) Encodage
+        ui(status_var.set, f"🔐 {tag} Application de l'encodage...")
+        choice = job.choice
         if choice == "ROT13":
-            encoded = encode_rot13(text)
+            encoded = encode_rot13(job.text)
         elif choice == "Inverser":
-             encoded = encode_reverse(text)
+             encoded = encode_reverse(job.text)
         elif choice == "Base64": # Ajout de la gestion Base64
-             encoded = encode_base64(text)
+             encoded = encode_base64(job.text)
              if encoded.startswith("ERREUR_BASE64:"):
-                 status_var.set(f"❌ {encoded}")
+                 ui(status_var.set, f"❌ {tag} {encoded}")
                  return
         else: # Classique (aucun encodage spécial)
-            encoded = text
+            encoded = job.text
 
         if not encoded:
-             status_var.set("❗ Le texte encodé est vide.")
+             ui(status_var.set, f"❗ {tag} Le texte encodé est vide.")
              return
 
-        # 3) Affiche les fréquences
-        status_var.set("🎶 Calcul des fréquences...")
+        # 2) Affiche les fréquences
+        ui(status_var.set, f"🎶 {tag} Calcul des fréquences...")
         # Utilise la fréquence de base configurable
-        freqs = text_to_freq(encoded, base_freq)
-
-        freq_box.config(state="normal")
-        freq_box.delete("1.0", "end")
-        freq_box.insert("end", f"🔄 Encodage : {choice}\n")
-        freq_box.insert("end", f"📻 Fréquence de base : {base_freq} Hz\n")
-        freq_box.insert("end", f"⏱️ Durée par caractère : {note_duration} s\n\n")
+        freqs = text_to_freq(encoded, job.base_freq)
+
+        lines = [
+            f"🔄 Encodage : {choice}\n",
+            f"📻 Fréquence de base : {job.base_freq} Hz\n",
+            f"⏱️ Durée par caractère : {job.note_duration} s\n",
+            f"〰️ Forme d'onde : {job.waveform}\n\n",
+        ]
+
+        # Seuls les codes 32 à 126 sont décodables : les accents reviennent en « \ufffd », et un ton
+        # au-delà de 22,05 kHz se replie sur un autre caractère (certains idéogrammes, par exemple)
+        decoded = decodable_text(encoded, job.base_freq, job.note_duration, job.waveform)
+        undecodable = sum(1 for a, b in zip(encoded, decoded) if a != b)
+        if undecodable:
+            lines.append(f"⚠️ {undecodable} caractère(s) ne seront pas restitués tels quels par le décodeur "
+                         f"(« \ufffd » ou caractère replié)\n\n")
 
         # Limite l'affichage des fréquences pour les longs textes
         max_display_chars = 200
@@ -141,30 +192,53 @@ def play_sound():
         if len(encoded) > max_display_chars:
              display_text = encoded[:max_display_chars] + "..."
              display_freqs = freqs[:max_display_chars]
-             freq_box.insert("end", f"(Affichage limité aux {max_display_chars} premiers caractères)\n\n")
+             lines.append(f"(Affichage limité aux {max_display_chars} premiers caractères)\n\n")
 
         for ch, f in zip(display_text, display_freqs):
-            freq_box.insert("end", f"'{ch}' → {f:.2f} Hz\n")
+            lines.append(f"'{ch}' → {f:.2f} Hz\n")
 
-        freq_box.config(state="disabled")
+        ui(show_freqs, lines)
 
-        # 4) Génère le .wav
-        status_var.set("🔊 Génération des données audio...")
-        snd = generate_tone(freqs, note_duration)
+        # 3) Génère le .wav, par blocs pour pouvoir annuler en cours de route
+        def progress(done, total):
+            ui(status_var.set, f"🔊 {tag} Génération des données audio : {done}/{total} caractères...")
+
+        snd = render_tone(freqs, job.note_duration, job.waveform, job.cancelled, progress)
+        if snd is None or job.cancelled.is_set():
+            ui(status_var.set, f"⏹️ {tag} Génération annulée.")
+            return
 
         if snd.size == 0:
-             status_var.set("❗ Pas de données audio générées. Texte trop court ou durée nulle ?")
+             ui(status_var.set, f"❗ {tag} Pas de données audio générées. Texte trop court ou durée nulle ?")
              return
 
         # Assurez-vous que les valeurs sont dans la plage int16
         data = (snd * 32767).astype(np.int16)
 
         fn = f"sound_{choice.replace(' ', '_').replace('/', '_')}.wav" # Nom de fichier plus sûr
-        status_var.set(f"💾 Écriture du fichier : {fn}...")
-        write(fn, 44100, data)
+        ui(status_var.set, f"💾 {tag} Écriture du fichier : {fn}...")
+        # Écrit à côté puis remplace : deux jobs du même encodage ne s'écrasent jamais à moitié
+        tmp_fn = f"{fn}.{job.id}.tmp"
+        write(tmp_fn, 44100, data)
+        # L'index est construit hors verrou : seul le remplacement des fichiers est sérialisé
+        index = build_index(decoded, data, job.note_duration, job.waveform, job.base_freq) if job.with_index else None
+        if job.cancelled.is_set():
+            os.remove(tmp_fn)
+            ui(status_var.set, f"⏹️ {tag} Génération annulée.")
+            return
 
-        # 5) Lance la lecture avec le lecteur système
-        status_var.set(f"▶️ Lancement de la lecture système...")
+        index_fn = index_path(fn)
+        with output_lock(fn):
+            os.replace(tmp_fn, fn)
+            # Index compagnon : sans lui, un ancien index du même nom ne correspondrait plus au WAV
+            if index is not None:
+                ui(status_var.set, f"🗂️ {tag} Écriture de l'index : {index_fn}...")
+                write_index(index_fn, index)
+            elif os.path.exists(index_fn):
+                os.remove(index_fn)
+
+        # 4) Lance la lecture avec le lecteur système
+        ui(status_var.set, f"▶️ {tag} Lancement de la lecture système...")
         try:
             if sys.platform.startswith("win"):
                 os.startfile(fn)
@@ -172,22 +246,53 @@ def play_sound():
                 subprocess.Popen(["open", fn])
             else:
                 subprocess.Popen(["xdg-open", fn])
-            status_var.set(f"✅ Fichier généré : {fn} (lecture système lancée)")
+            ui(status_var.set, f"✅ {tag} Fichier généré : {fn} (lecture système lancée)")
         except FileNotFoundError:
-             status_var.set(f"⚠️ Impossible de lancer la lecture système. Fichier généré : {fn}")
+             ui(status_var.set, f"⚠️ {tag} Impossible de lancer la lecture système. Fichier généré : {fn}")
         except Exception as e:
-             status_var.set(f"⚠️ Erreur lors du lancement de la lecture système : {e}. Fichier généré : {fn}")
+             ui(status_var.set, f"⚠️ {tag} Erreur lors du lancement de la lecture système : {e}. Fichier généré : {fn}")
 
 
     except Exception as e:
         traceback.print_exc()
-        status_var.set(f"❌ Erreur : {type(e).__name__} - {e}")
-        messagebox.showerror("Erreur Générateur", f"Une erreur est survenue : {e}\nVoir la console pour plus de détails.")
+        ui(status_var.set, f"❌ {tag} Erreur : {type(e).__name__} - {e}")
+        ui(messagebox.showerror, "Erreur Générateur", f"Une erreur est survenue : {e}\nVoir la console pour plus de détails.")
+
+# Deux générations au plus en parallèle, quatre en attente : CPU et mémoire restent bornés
+scheduler = GenerationScheduler(generate_job, workers=2, max_pending=4)
 
 
 def on_click_play():
-    # Lance la génération et la lecture dans un thread pour garder la GUI réactive
-    threading.Thread(target=play_sound).start()
+    """Lit le texte et les paramètres (thread Tkinter) puis met la génération en file."""
+    text = text_entry.get("1.0", "end").strip()
+    if not text:
+        status_var.set("❗ Entrez du texte !")
+        return
+
+    try:
+        # Récupère la fréquence de base et la durée (configurables dans cette version du générateur)
+        base_freq = float(base_freq_entry.get())
+        note_duration = float(duration_entry.get())
+        if base_freq <= 0 or note_duration <= 0:
+             status_var.set("❗ Fréquence de base et durée doivent être positives.")
+             return
+    except ValueError:
+        status_var.set("❗ Veuillez entrer des nombres valides pour la fréquence et la durée.")
+        return
+
+    job = GenerationJob(text, encoding_cb.get(), waveform_cb.get(), base_freq, note_duration, index_var.get())
+    result = scheduler.submit(job)
+    if result == "queued":
+        status_var.set(f"⏳ [#{job.id}] Génération en file d'attente ({scheduler.pending_count()} en attente)...")
+    elif result == "coalesced":
+        status_var.set("ℹ️ Une demande identique est déjà en attente.")
+    else:
+        status_var.set("❗ File d'attente pleine : attendez la fin des générations ou annulez-les.")
+
+def on_click_cancel():
+    """Annule les générations en attente et demande l'arrêt de celles en cours."""
+    count = scheduler.cancel_all()
+    status_var.set(f"⏹️ Annulation de {count} génération(s)..." if count else "Aucune génération en cours.")
 
 def clear_text():
     """Efface les zones de texte et de statut."""
@@ -198,10 +303,16 @@ def clear_text():
     freq_box.config(state="disabled")
     status_var.set("") # Efface le statut
 
+def on_waveform_selected(event=None):
+    """Remet la durée par caractère à la valeur par défaut de la forme d'onde (celle du profil du décodeur)."""
+    duration_entry.delete(0, tk.END)
+    duration_entry.insert(0, str(default_durations[waveform_cb.get()]))
+
 def on_click_decode():
     """Lance le script de décodage externe."""
     status_var.set("▶️ Lancement de l'outil de décodage externe...")
-    decoder_script_name = "decoder.py" # Assurez-vous que ce nom correspond à votre fichier
+    # Le décodeur Lyrivox-LST est livré à côté de ce script
+    decoder_script_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Lyrivox-LST-1.5.0.py")
 
     # Vérifie si le fichier décodeur existe
     if not os.path.exists(decoder_script_name):
@@ -296,6 +407,13 @@ encoding_cb = ttk.Combobox(encoding_frame, values=["Classique", "ROT13", "Invers
 encoding_cb.current(0)
 encoding_cb.pack(fill="x")
 
+# Forme d'onde : "Phase continue" supprime les silences et les clics entre symboles
+ttk.Label(encoding_frame, text="Forme d'onde :").pack(anchor="w", pady=(5, 5))
+waveform_cb = ttk.Combobox(encoding_frame, values=["Classique", "Phase continue"], state="readonly", width=15)
+waveform_cb.current(0)
+waveform_cb.pack(fill="x")
+waveform_cb.bind("<<ComboboxSelected>>", on_waveform_selected)
+
 # Options de configuration (colonne 1) - Fréquence de base et Durée sont configurables ici
 config_frame = ttk.Frame(options_frame)
 config_frame.pack(side="left", fill="x", expand=True, padx=(10, 0))
@@ -314,9 +432,15 @@ duration_frame = ttk.Frame(config_frame)
 duration_frame.pack(fill="x", pady=(0, 5))
 ttk.Label(duration_frame, text="Durée par caractère (s) :").pack(side="left", padx=(0, 5))
 duration_entry = tk.Entry(duration_frame, width=10, **entry_style_options)
-duration_entry.insert(0, "0.1") # Valeur par défaut
+duration_entry.insert(0, str(default_durations[waveform_cb.get()])) # Valeur par défaut de la forme d'onde
 duration_entry.pack(side="left", fill="x", expand=True)
 
+# Index de recherche : permet au décodeur de chercher et décoder une section sans tout relire
+style.configure("TCheckbutton", background="#333333", foreground="#f0f0f0", font=("Segoe UI", 10))
+index_var = tk.BooleanVar(value=False)
+index_check = ttk.Checkbutton(config_frame, text="Index de recherche (.lyxidx)", variable=index_var)
+index_check.pack(anchor="w", pady=(0, 5))
+
 
 # Zone d'affichage des fréquences (similaire à la sortie du décodeur)
 ttk.Label(frm, text="Détails des fréquences générées :").pack(anchor="w", pady=(0, 5))
@@ -343,7 +467,10 @@ clear_btn = ttk.Button(button_frame, text="✕ Effacer", command=clear_text, sty
 clear_btn.pack(side="left", fill="x", expand=True, padx=(5, 5))
 
 decode_btn = ttk.Button(button_frame, text="🔍 Décoder (Externe)", command=on_click_decode, style="Decode.TButton")
-decode_btn.pack(side="left", fill="x", expand=True, padx=(5, 0))
+decode_btn.pack(side="left", fill="x", expand=True, padx=(5, 5))
+
+cancel_btn = ttk.Button(button_frame, text="⏹ Annuler", command=on_click_cancel, style="TButton")
+cancel_btn.pack(side="left", fill="x", expand=True, padx=(5, 0))
 
 
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,508 @@
+import argparse
+import base64
+import io
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from scipy.io.wavfile import write, read
+
+# Encodages, synthèse, détection et grille des symboles : module partagé avec Lyrivox-S et Lyrivox-LST
+from lyrivox_signal import (
+    encoders, generators, text_to_freq, freq_to_char, freq_to_bit, get_dominant_freq,
+    symbol_count, symbol_offsets, symbol_freqs,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+)
+
+# Paramètres du service
+default_host = "127.0.0.1"
+default_port = 8765
+default_rate = 44100
+max_body_size = 64 * 1024 * 1024 # Refuse les requêtes de plus de 64 Mo
+stats_window = 60.0 # Fenêtre (s) pour le calcul du débit
+job_timeout = 120.0 # Délai maximal (s) d'un job : un worker tué ne bloque pas la requête indéfiniment
+
+# Limites vérifiées avant d'envoyer un job au pool (réponse 400 au-delà)
+min_symbol_duration = 0.001
+max_symbol_duration = 10.0
+min_rate = 8000
+max_rate = 192000
+max_symbols = 100000 # Caractères après encodage
+max_output_samples = 32 * 1024 * 1024 # ~12 min à 44,1 kHz, ~256 Mo en float64 pendant la synthèse
+max_batch_items = 256
+
+# ---- Processus de travail (gardés chauds entre les requêtes) ----
+
+def _init_worker():
+    """Précharge NumPy dans un processus de travail."""
+    # Premier appel FFT pour charger les routines NumPy avant la première requête
+    get_dominant_freq(np.zeros(int(default_rate * 0.1)), default_rate)
+    logging.debug("Worker ready.")
+
+def _warmup(_):
+    return multiprocessing.current_process().name
+
+def task_encode(params):
+    """Texte -> octets WAV. Exécuté dans un processus de travail."""
+    text = params.get("text", "")
+    encoding = params.get("encoding", "Classique")
+    base_freq = float(params.get("base_freq", 1000))
+    duration = float(params.get("duration", 0.1))
+    rate = int(params.get("rate", default_rate))
+    waveform = params.get("waveform", "Classique")
+
+    if encoding not in encoders:
+        raise ValueError(f"Encodage inconnu : {encoding}")
+    if waveform not in generators:
+        raise ValueError(f"Forme d'onde inconnue : {waveform}")
+    if base_freq <= 0 or duration <= 0:
+        raise ValueError("Fréquence de base et durée doivent être positives.")
+
+    encoded = encoders[encoding](text)
+    freqs = text_to_freq(encoded, base_freq)
+
+    snd = generators[waveform](freqs, duration, rate)
+    data = (snd * 32767).astype(np.int16)
+
+    buf = io.BytesIO()
+    write(buf, rate, data)
+    return {"wav": buf.getvalue(), "symbols": len(freqs), "encoded": encoded}
+
+def task_decode(params):
+    """Octets WAV -> texte ou octets décodés. Exécuté dans un processus de travail."""
+    mode = params.get("mode", "text")
+    base_freq = float(params.get("base_freq", 1000))
+    duration = float(params.get("duration", 0.1))
+    waveform = params.get("waveform", "Classique")
+
+    rate, data = read(io.BytesIO(params["wav"]))
+    if data.ndim > 1:
+        data = data[:, 0]
+    if np.issubdtype(data.dtype, np.integer):
+        data = data.astype(np.float32) / np.iinfo(data.dtype).max
+    else:
+        data = data.astype(np.float32)
+
+    return decode_samples(data, rate, mode, base_freq, duration, waveform)
+
+def decode_samples(data, rate, mode="text", base_freq=1000, duration=0.1, waveform="Classique", interpolate=True):
+    """Décode des échantillons flottants, un bloc par symbole aligné sur la grille du générateur."""
+    if mode not in ("text", "binary"):
+        raise ValueError(f"Mode inconnu : {mode}")
+    if waveform not in generators:
+        raise ValueError(f"Forme d'onde inconnue : {waveform}")
+    if duration <= 0:
+        raise ValueError("La durée doit être positive.")
+
+    chars = []
+    bits = []
+    bounds = symbol_offsets(symbol_count(len(data), duration, waveform, rate), duration, waveform, rate)
+    for freq in symbol_freqs(data, bounds, rate, waveform, duration, interpolate):
+        if freq == 0:
+            continue
+        if mode == 'text':
+            char = freq_to_char(freq, base_freq)
+            if char:
+                chars.append(char)
+        else:
+            bit = freq_to_bit(freq)
+            if bit is not None:
+                bits.append(bit)
+
+    if mode == 'text':
+        return {"mode": mode, "text": ''.join(chars), "symbols": len(chars)}
+
+    usable = len(bits) - len(bits) % 8
+    packed = np.packbits(np.array(bits[:usable], dtype=np.uint8)).tobytes() if usable else b""
+    return {"mode": mode, "bytes": packed.hex(), "symbols": len(bits), "leftover_bits": len(bits) - usable}
+
+# ---- Vérification des requêtes (dans le serveur, avant d'occuper un worker) ----
+
+def _bounded(params, name, default, convert, low, high):
+    """Lit un paramètre numérique et vérifie qu'il est dans [low, high] (NaN refusé)."""
+    value = convert(params.get(name, default))
+    if not low <= value <= high:
+        raise ValueError(f"{name} doit être compris entre {low} et {high} (reçu {value}).")
+    return value
+
+def check_encode(params):
+    """Refuse une demande d'encodage dont le son dépasserait les limites du service."""
+    text = params.get("text", "")
+    encoding = params.get("encoding", "Classique")
+    if not isinstance(text, str):
+        raise TypeError("text doit être une chaîne.")
+    if encoding not in encoders:
+        raise ValueError(f"Encodage inconnu : {encoding}")
+    duration = _bounded(params, "duration", 0.1, float, min_symbol_duration, max_symbol_duration)
+    rate = _bounded(params, "rate", default_rate, int, min_rate, max_rate)
+    symbols = len(encoders[encoding](text))
+    if symbols > max_symbols:
+        raise ValueError(f"Texte trop long : {symbols} symboles après encodage (maximum {max_symbols}).")
+    if symbols * duration * rate > max_output_samples:
+        raise ValueError(f"Son trop long : {int(symbols * duration * rate)} échantillons (maximum {max_output_samples}).")
+
+def check_decode(params):
+    """Refuse une demande de décodage aux paramètres hors limites (la taille du WAV est bornée par max_body_size)."""
+    _bounded(params, "duration", 0.1, float, min_symbol_duration, max_symbol_duration)
+
+def check_batch(items):
+    if not isinstance(items, list):
+        raise TypeError("items doit être une liste.")
+    if len(items) > max_batch_items:
+        raise ValueError(f"Lot trop grand : {len(items)} éléments (maximum {max_batch_items}).")
+
+# ---- Statistiques de latence et de débit ----
+
+class ServiceStats:
+    """Collecte les latences des requêtes et calcule percentiles et débit."""
+
+    def __init__(self, max_samples=10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=max_samples)
+        self._completions = deque()
+        self.started = time.monotonic()
+        self.total = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def end(self, started, items=1, error=False):
+        elapsed = time.perf_counter() - started
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.total += items
+            if error:
+                self.errors += 1
+            self._latencies.append(elapsed)
+            self._completions.append((now, items))
+            while self._completions and now - self._completions[0][0] > stats_window:
+                self._completions.popleft()
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            now = time.monotonic()
+            recent = sum(n for t, n in self._completions if now - t <= stats_window)
+            span = min(stats_window, now - self.started) or 1e-9
+            snap = {
+                "uptime_s": round(now - self.started, 3),
+                "items_total": self.total,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "throughput_items_per_s": round(recent / span, 3),
+            }
+        if latencies.size:
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            snap.update({
+                "latency_ms_p50": round(float(p50), 3),
+                "latency_ms_p90": round(float(p90), 3),
+                "latency_ms_p99": round(float(p99), 3),
+                "latency_ms_max": round(float(latencies.max()), 3),
+            })
+        return snap
+
+# ---- Serveur HTTP ----
+
+class LyrivoxHandler(BaseHTTPRequestHandler):
+    """Expose /encode, /decode et /stats. Le serveur porte le pool et les statistiques."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "Lyrivox-SRV/1.5.0"
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > max_body_size:
+            raise OverflowError(f"Requête trop volumineuse ({length} octets).")
+        return self.rfile.read(length) if length > 0 else b""
+
+    def _stream_results(self, results, total):
+        """Envoie chaque résultat dès qu'il est prêt (NDJSON en transfert chunked)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        count = 0
+        failed = False
+        for index in range(total):
+            timed_out = False
+            try:
+                result = results.next(job_timeout)
+            except multiprocessing.TimeoutError:
+                # Les éléments restants ne sont pas attendus : le client voit où le lot s'est arrêté
+                logging.error(f"Batch item {index} timed out after {job_timeout} s.")
+                result = {"error": f"Délai dépassé ({job_timeout} s)."}
+                timed_out = True
+            line = (json.dumps({"index": index, **result}, ensure_ascii=False) + "\n").encode('utf-8')
+            self.wfile.write(f"{len(line):X}\r\n".encode('ascii') + line + b"\r\n")
+            self.wfile.flush()
+            count += 1
+            failed = failed or "error" in result
+            if timed_out:
+                break
+        self.wfile.write(b"0\r\n\r\n")
+        return count, failed
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        elif path == "/health":
+            self._send_json(200, {"status": "ok", "workers": self.server.workers})
+        else:
+            self._send_json(404, {"error": f"Chemin inconnu : {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ("/encode", "/decode"):
+            self._send_json(404, {"error": f"Chemin inconnu : {url.path}"})
+            return
+
+        started = self.server.stats.begin()
+        items = 1
+        error = False
+        try:
+            body = self._read_body()
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            content_type = self.headers.get("Content-Type", "")
+            if url.path == "/encode":
+                items, error = self._handle_encode(body, params, content_type)
+            else:
+                items, error = self._handle_decode(body, params, content_type)
+        except OverflowError as e:
+            error = True
+            # Le corps n'a pas été lu : la connexion ne peut pas servir une autre requête
+            self.close_connection = True
+            self._send_json(413, {"error": str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            error = True
+            self.close_connection = True
+            self._send_json(400, {"error": f"{type(e).__name__} - {e}"})
+        except multiprocessing.TimeoutError:
+            error = True
+            logging.error(f"Job for {url.path} timed out after {job_timeout} s.")
+            self._send_json(504, {"error": f"Délai dépassé ({job_timeout} s)."})
+        except Exception as e:
+            error = True
+            logging.error(f"Unexpected error while handling {url.path}: {e}", exc_info=True)
+            self._send_json(500, {"error": f"{type(e).__name__} - {e}"})
+        finally:
+            self.server.stats.end(started, items=items, error=error)
+
+    def _handle_encode(self, body, params, content_type):
+        if content_type.startswith("application/json"):
+            payload = json.loads(body or b"{}")
+        else:
+            payload = dict(params, text=body.decode('utf-8'))
+
+        if "items" in payload:
+            check_batch(payload["items"])
+            jobs = [dict(params, **item) for item in payload["items"]]
+            for job in jobs:
+                check_encode(job)
+            results = self.server.pool.imap(_safe_encode, jobs)
+            return self._stream_results(results, len(jobs))
+
+        job = dict(params, **payload)
+        check_encode(job)
+        result = self.server.pool.apply_async(task_encode, (job,)).get(job_timeout)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(result["wav"])))
+        self.send_header("X-Lyrivox-Symbols", str(result["symbols"]))
+        self.end_headers()
+        self.wfile.write(result["wav"])
+        return 1, False
+
+    def _handle_decode(self, body, params, content_type):
+        if content_type.startswith("application/json"):
+            payload = json.loads(body or b"{}")
+            # En JSON, /decode n'accepte que des lots : un WAV seul s'envoie en corps brut
+            if not isinstance(payload, dict) or "items" not in payload:
+                raise ValueError("Corps JSON sans champ items : envoyez un lot {\"items\": [...]} ou le WAV en corps brut.")
+            check_batch(payload["items"])
+            jobs = [dict(params, **item) for item in payload["items"]]
+            for job in jobs:
+                check_decode(job)
+                job["wav"] = base64.b64decode(job["wav"])
+            results = self.server.pool.imap(_safe_decode, jobs)
+            return self._stream_results(results, len(jobs))
+
+        job = dict(params, wav=body)
+        check_decode(job)
+        result = self.server.pool.apply_async(task_decode, (job,)).get(job_timeout)
+        self._send_json(200, result)
+        return 1, False
+
+def _safe_encode(params):
+    """Variante de task_encode pour les lots : une erreur n'interrompt pas le flux."""
+    try:
+        result = task_encode(params)
+        return {"wav": base64.b64encode(result["wav"]).decode('ascii'), "symbols": result["symbols"]}
+    except Exception as e:
+        return {"error": f"{type(e).__name__} - {e}"}
+
+def _safe_decode(params):
+    """Variante de task_decode pour les lots : une erreur n'interrompt pas le flux."""
+    try:
+        return task_decode(params)
+    except Exception as e:
+        return {"error": f"{type(e).__name__} - {e}"}
+
+class LyrivoxServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers):
+        super().__init__(address, LyrivoxHandler)
+        self.workers = workers
+        self.stats = ServiceStats()
+        self.pool = multiprocessing.Pool(processes=workers, initializer=_init_worker)
+        # Force le démarrage de tous les processus avant d'accepter des requêtes
+        self.pool.map(_warmup, range(workers), chunksize=1)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+
+def serve(host, port, workers):
+    server = LyrivoxServer((host, port), workers)
+    logging.info(f"Lyrivox service listening on http://{host}:{server.server_address[1]} with {workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutdown requested.")
+    finally:
+        server.server_close()
+
+# ---- Banc de charge ----
+
+def bench(url, requests_count, concurrency, text):
+    """Envoie des requêtes /encode concurrentes puis affiche les statistiques du service."""
+    payload = json.dumps({"text": text}).encode('utf-8')
+
+    def one(_):
+        req = urllib.request.Request(f"{url}/encode", data=payload, headers={"Content-Type": "application/json"})
+        started = time.perf_counter()
+        with urllib.request.urlopen(req) as resp:
+            resp.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(one, range(requests_count)))) * 1000.0
+    elapsed = time.perf_counter() - started
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"{requests_count} requêtes, concurrence {concurrency} : {requests_count / elapsed:.1f} req/s")
+    print(f"Latence client (ms) : p50={p50:.1f} p90={p90:.1f} p99={p99:.1f} max={latencies.max():.1f}")
+    with urllib.request.urlopen(f"{url}/stats") as resp:
+        print(f"Statistiques serveur : {resp.read().decode('utf-8')}")
+
+def bench_waveforms(chars, snr_db, jitter_ms, seed):
+    """Compare les deux formes d'onde : fuite spectrale et débit fiable sur un canal simulé."""
+    rng = np.random.default_rng(seed)
+    text = ''.join(chr(c) for c in rng.integers(32, 127, size=chars))
+    freqs = text_to_freq(text, 1000)
+    rate = default_rate
+    symbol_freqs = np.unique(freqs)
+
+    # 1) Fuite spectrale : part de l'énergie loin (> 5 Hz) de toute fréquence de symbole émise
+    print(f"Fuite spectrale ({chars} caractères aléatoires, 50 ms par symbole) :")
+    for waveform, generator in generators.items():
+        snd = generator(freqs, 0.05, rate)
+        power = np.abs(np.fft.rfft(snd)) ** 2
+        axis = np.fft.rfftfreq(len(snd), d=1/rate)
+        nearest = np.abs(axis[:, None] - symbol_freqs[None, :]).min(axis=1)
+        leak = power[nearest > 5].sum() / power.sum()
+        out_of_band = power[nearest > 100].sum() / power.sum()
+        print(f"  {waveform:15s} hors symboles : {10 * np.log10(leak):6.1f} dB   hors bande (>100 Hz) : {10 * np.log10(out_of_band):6.1f} dB")
+
+    # 2) Canal simulé : bruit blanc gaussien et retard inconnu du décodeur.
+    # Les deux formes d'onde passent par le même détecteur hors ligne (fenêtres de symbole, fréquence interpolée) :
+    # l'écart mesuré vient de la forme d'onde seule. Les profils en direct se mesurent avec Lyrivox-LST --bench.
+    print(f"Canal simulé (RSB {snr_db} dB, retard aléatoire jusqu'à {jitter_ms} ms, même détecteur hors ligne) :")
+    noise_std = np.sqrt(0.4 ** 2 / 2 / 10 ** (snr_db / 10))
+    durations = [0.1, 0.05, 0.03, 0.02, 0.015, 0.012, 0.01, 0.008, 0.006, 0.005]
+    for waveform, generator in generators.items():
+        best = None
+        for duration in durations:
+            snd = generator(freqs, duration, rate)
+            delay = np.zeros(int(rng.uniform(0, jitter_ms / 1000) * rate))
+            received = np.concatenate([delay, snd]) + rng.normal(0, noise_std, len(delay) + len(snd))
+            started = time.perf_counter()
+            decoded = decode_samples(received, rate, duration=duration, waveform=waveform, interpolate=True)["text"]
+            elapsed = time.perf_counter() - started
+            errors = sum(a != b for a, b in zip(decoded, text)) + abs(len(decoded) - len(text))
+            print(f"  {waveform:15s} {duration * 1000:5.1f} ms : {errors:4d} erreurs / {chars}, "
+                  f"{1 / duration:6.1f} car/s, décodage {len(snd) / rate / max(elapsed, 1e-9):6.0f}x temps réel")
+            if errors:
+                break # Plus courte durée sans erreur : toutes les durées plus longues le sont aussi
+            best = duration
+        if best:
+            print(f"  -> {waveform} : plus courte durée sans erreur {best * 1000:.1f} ms ({1 / best:.1f} car/s)")
+        else:
+            print(f"  -> {waveform} : aucune durée testée sans erreur")
+
+# Point d'entrée principal du script
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Service local d'encodage/décodage Lyrivox.")
+    sub = parser.add_subparsers(dest="command")
+
+    serve_parser = sub.add_parser("serve", help="Démarre le service HTTP local.")
+    serve_parser.add_argument("--host", default=default_host)
+    serve_parser.add_argument("--port", type=int, default=default_port)
+    serve_parser.add_argument("--workers", type=int, default=max(1, (multiprocessing.cpu_count() or 2) - 1))
+
+    bench_parser = sub.add_parser("bench", help="Mesure latence et débit d'un service en cours d'exécution.")
+    bench_parser.add_argument("--url", default=f"http://{default_host}:{default_port}")
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=8)
+    bench_parser.add_argument("--text", default="Hello Lyrivox")
+
+    waveforms_parser = sub.add_parser("waveforms", help="Compare fuite spectrale et débit des formes d'onde.")
+    waveforms_parser.add_argument("--chars", type=int, default=300)
+    waveforms_parser.add_argument("--snr", type=float, default=20.0)
+    waveforms_parser.add_argument("--jitter-ms", type=float, default=2.0)
+    waveforms_parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args.url, args.requests, args.concurrency, args.text)
+    elif args.command == "waveforms":
+        bench_waveforms(args.chars, args.snr, args.jitter_ms, args.seed)
+    elif args.command == "serve":
+        serve(args.host, args.port, args.workers)
+    else:
+        parser.print_help()
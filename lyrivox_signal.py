@@ -0,0 +1,299 @@
+"""Code signal commun à Lyrivox-S, Lyrivox-LST et Lyrivox-SRV.
+
+Encodages, mappage fréquence <-> caractère, formes d'onde, détection de fréquence,
+grille des symboles et format de l'index .lyxidx. Ce fichier doit rester à côté des scripts.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# ---- Fonctions d'encodage ----
+
+def encode_rot13(text):
+    """Applique l'encodage ROT13 au texte."""
+    return text.translate(str.maketrans(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
+        "NOPQRSTUVWXYZABCDEFGHIJKLMnopqrstuvwxyzabcdefghijklm"
+    ))
+
+def encode_reverse(text):
+    """Inverse simplement la chaîne."""
+    return text[::-1]
+
+def encode_base64(text):
+    """Encode le texte en Base64."""
+    try:
+        # Base64 opère sur des octets, donc on encode d'abord la chaîne en bytes (UTF-8 est courant)
+        encoded_bytes = base64.b64encode(text.encode('utf-8'))
+        # Decode les bytes résultants en chaîne ASCII
+        return encoded_bytes.decode('ascii')
+    except Exception as e:
+        logging.error(f"Erreur lors de l'encodage Base64 : {e}")
+        return f"ERREUR_BASE64:{e}" # Signale une erreur d'encodage
+
+encoders = {
+    "Classique": lambda text: text,
+    "ROT13": encode_rot13,
+    "Inverser": encode_reverse,
+    "Base64": encode_base64,
+}
+
+# ---- Mappage Fréquence ----
+
+def text_to_freq(text, base_freq):
+    """Convertit chaque caractère d'un texte en une fréquence basée sur une fréquence de base."""
+    # Mappage simple : fréquence de base + valeur ord * 10
+    return [base_freq + ord(c)*10 for c in text]
+
+def freq_to_char(freq, base_freq=1000):
+    code = int(round((freq - base_freq) / 10))
+    if 32 <= code <= 126:
+        return chr(code)
+    return None
+
+def freq_to_bit(freq):
+    if 950 <= freq <= 1050:
+        return 0
+    if 1950 <= freq <= 2050:
+        return 1
+    return None
+
+# ---- Génération Son ----
+
+note_duration_factor = 0.9 # "Classique" : part de la note dans chaque symbole, le reste est un silence
+transition_factor = 0.2 # "Phase continue" : durée de la rampe de fréquence, en fraction de symbole
+
+def generate_tone(freqs, duration, rate=44100):
+    """Génère une séquence de tons WAV à partir d'une liste de fréquences."""
+    if duration <= 0:
+         return np.array([])
+
+    silence_duration_factor = 1 - note_duration_factor
+
+    note_duration = duration * note_duration_factor
+    silence_duration = duration * silence_duration_factor
+
+    all_samples = []
+
+    samples_per_silence = int(rate * silence_duration)
+    silence_segment = np.zeros(samples_per_silence)
+
+    samples_per_note = int(rate * note_duration)
+    t_note = np.linspace(0, note_duration, samples_per_note, endpoint=False) if samples_per_note > 0 else np.array([])
+
+
+    for f in freqs:
+        if samples_per_note > 0:
+            tone = 0.4 * np.sin(2 * np.pi * f * t_note)
+            all_samples.append(tone)
+
+        if samples_per_silence > 0:
+            all_samples.append(silence_segment)
+
+    if not all_samples:
+        return np.array([])
+
+    return np.concatenate(all_samples)
+
+def iter_tone_continuous(freqs, duration, rate=44100, transition_factor=transition_factor, block_symbols=256):
+    """Génère la séquence FSK à phase continue par blocs de symboles (même signal qu'en un seul tenant)."""
+    if duration <= 0 or not len(freqs):
+        return
+
+    freqs = np.asarray(freqs, dtype=float)
+    count = len(freqs)
+    # Bornes des symboles arrondies depuis le début : pas de dérive sur les longs textes
+    bounds = np.round(np.arange(count + 1) * duration * rate).astype(int)
+    total = bounds[-1]
+
+    # La fréquence passe d'un symbole au suivant par une rampe en cosinus surélevé
+    ramp = int(rate * duration * transition_factor)
+    if ramp > 1:
+        kernel = np.hanning(ramp + 2)[1:-1]
+        kernel /= kernel.sum()
+        # Attaque et relâchement en cosinus surélevé au début et à la fin de la transmission
+        edge = 0.5 - 0.5 * np.cos(np.pi * np.arange(ramp) / ramp)
+
+    phase_start = 0.0
+    for first in range(0, count, block_symbols):
+        last = min(count, first + block_symbols)
+        # Un symbole de contexte de chaque côté suffit : la rampe est plus courte qu'un symbole
+        lo, hi = max(0, first - 1), min(count, last + 1)
+        track = np.repeat(freqs[lo:hi], np.diff(bounds[lo:hi + 1]))
+        if ramp > 1:
+            padded = np.pad(track, (ramp // 2, ramp - 1 - ramp // 2), mode='edge')
+            track = np.convolve(padded, kernel, mode='valid')
+        track = track[bounds[first] - bounds[lo]:bounds[last] - bounds[lo]]
+        if not len(track):
+            continue
+
+        # Phase intégrée sans rupture, y compris d'un bloc à l'autre
+        phase = phase_start + 2 * np.pi * np.cumsum(track) / rate
+        phase_start = phase[-1]
+
+        envelope = np.ones(len(track))
+        if ramp > 1:
+            start, end = bounds[first], bounds[last]
+            if start < ramp:
+                n = min(ramp, end) - start
+                envelope[:n] = edge[start:start + n]
+            if end > total - ramp:
+                fade_from = max(start, total - ramp)
+                fade = edge[::-1][fade_from - (total - ramp):]
+                envelope[fade_from - start:] = np.minimum(envelope[fade_from - start:], fade)
+
+        yield 0.4 * envelope * np.sin(phase)
+
+def generate_tone_continuous(freqs, duration, rate=44100, transition_factor=transition_factor):
+    """Génère une séquence FSK à phase continue, sans silence ni clic entre les symboles."""
+    blocks = list(iter_tone_continuous(freqs, duration, rate, transition_factor))
+    if not blocks:
+        return np.array([])
+    return np.concatenate(blocks)
+
+generators = {
+    "Classique": generate_tone,
+    "Phase continue": generate_tone_continuous,
+}
+
+# Durée par caractère proposée par défaut pour chaque forme d'onde, dans le générateur comme dans le décodeur
+default_durations = {
+    "Classique": 0.1,
+    "Phase continue": 0.05,
+}
+
+# ---- Détection ----
+
+@lru_cache(maxsize=32)
+def _analysis_axis(n, rate):
+    """Fenêtre de Hann et axe des fréquences pour n échantillons, réutilisés d'un bloc à l'autre."""
+    return np.hanning(n), np.fft.rfftfreq(n, d=1/rate)
+
+def get_dominant_freq(data, rate, interpolate=False):
+    """Fréquence du pic du spectre (0 si le bloc est muet)."""
+    window, freqs = _analysis_axis(len(data), rate)
+    fft = np.abs(np.fft.rfft(data * window))
+    max_amplitude = np.max(fft)
+    if max_amplitude < 1e-4:
+        return 0
+    dominant_freq_index = np.argmax(fft)
+    if interpolate:
+        # Précision bien meilleure que la largeur d'un bin, nécessaire pour les blocs courts (bins > 10 Hz)
+        return freqs[dominant_freq_index] + _peak_offset(fft, dominant_freq_index) * (freqs[1] - freqs[0])
+    return freqs[dominant_freq_index]
+
+def _peak_offset(fft, index):
+    """Décalage (en bins) du vrai pic par interpolation parabolique sur le log du spectre."""
+    if not 0 < index < len(fft) - 1:
+        return 0.0
+    a, b, c = np.log(fft[index - 1:index + 2] + 1e-12)
+    denom = a - 2 * b + c
+    return 0.5 * (a - c) / denom if denom != 0 else 0.0
+
+# ---- Grille des symboles ----
+
+guard_factor = 0.15 # "Phase continue" : marge ignorée de chaque côté du symbole (rampes de transition)
+
+def symbol_offsets(count, duration, waveform, rate=44100, first=0):
+    """Échantillon de début des symboles first..first+count (count + 1 bornes) sur la grille du générateur."""
+    symbols = np.arange(first, first + count + 1)
+    if waveform == "Phase continue":
+        return np.round(symbols * duration * rate).astype(int)
+    # generate_tone : note + silence, arrondis séparément (mêmes opérations que la synthèse)
+    step = int(rate * (duration * note_duration_factor)) + int(rate * (duration * (1 - note_duration_factor)))
+    return symbols * step
+
+def symbol_count(n_samples, duration, waveform, rate=44100):
+    """Nombre de symboles complets contenus dans n_samples échantillons."""
+    step = symbol_offsets(1, duration, waveform, rate)[1]
+    if step <= 0:
+        raise ValueError("Durée trop courte pour ce taux d'échantillonnage.")
+    # Estimation par excès (pas arrondi ou tronqué), puis ajustement sur les bornes exactes
+    count = int(n_samples / min(step, duration * rate)) + 1
+    while count > 0 and symbol_offsets(0, duration, waveform, rate, count)[0] > n_samples:
+        count -= 1
+    return count
+
+def analysis_windows(bounds, duration, waveform, rate=44100):
+    """(débuts, fins) analysés dans chaque symbole de bounds : la note sans son silence,
+    ou le centre du symbole hors rampes de transition."""
+    starts, ends = bounds[:-1], bounds[1:]
+    if waveform == "Phase continue":
+        guard = int(rate * duration * guard_factor)
+        return starts + guard, ends - guard
+    return starts, starts + int(rate * (duration * note_duration_factor))
+
+def symbol_freqs(data, bounds, rate, waveform, duration, interpolate=True):
+    """Fréquence dominante de chaque symbole de bounds (0 si muet) ; ne lit que ces échantillons."""
+    scale = np.iinfo(data.dtype).max if np.issubdtype(data.dtype, np.integer) else None
+    for start, end in zip(*analysis_windows(bounds, duration, waveform, rate)):
+        block = np.asarray(data[start:end], dtype=np.float32)
+        if scale:
+            block /= scale
+        yield get_dominant_freq(block, rate, interpolate) if len(block) else 0
+
+def decode_symbols(data, bounds, rate, waveform, duration, base_freq=1000, interpolate=True):
+    """Décode un caractère par intervalle de bounds ; un symbole non reconnu donne '\ufffd'."""
+    return ''.join(freq_to_char(freq, base_freq) or '\ufffd' # Un caractère par symbole, toujours
+                   for freq in symbol_freqs(data, bounds, rate, waveform, duration, interpolate))
+
+# ---- Index de recherche (fichier compagnon .lyxidx) ----
+
+index_block_chars = 256 # Caractères par bloc d'index : un CRC du texte et un CRC de l'audio par bloc
+
+def index_path(wav_path):
+    return f"{wav_path}.lyxidx"
+
+def decodable_text(text, base_freq=1000, duration=0.1, waveform="Classique", rate=44100):
+    """Le texte tel que le décodeur le restitue : chaque caractère distinct est synthétisé seul puis relu.
+    Un code hors 32-126 donne '\ufffd', mais un ton au-delà de rate/2 se replie et peut revenir imprimable."""
+    chars = list(set(text))
+    bounds = symbol_offsets(1, duration, waveform, rate)
+    table = {}
+    for c, f in zip(chars, text_to_freq(chars, base_freq)):
+        data = (generators[waveform]([f], duration, rate) * 32767).astype(np.int16)
+        table[c] = decode_symbols(data, bounds, rate, waveform, duration, base_freq)
+    return ''.join(table[c] for c in text)
+
+def make_index(text, data, bounds, rate, waveform, duration, base_freq, block_chars=index_block_chars):
+    """Index caractère -> échantillon du WAV par blocs, avec CRC32 du texte et des échantillons de chaque bloc."""
+    blocks = []
+    for first in range(0, len(text), block_chars):
+        last = min(len(text), first + block_chars)
+        chunk = text[first:last]
+        audio = np.ascontiguousarray(data[bounds[first]:bounds[last]])
+        blocks.append({
+            "char": first,
+            "sample": int(bounds[first]),
+            "samples": int(bounds[last] - bounds[first]),
+            "text": chunk,
+            "text_crc": zlib.crc32(chunk.encode('utf-8')),
+            "audio_crc": zlib.crc32(audio.tobytes()),
+        })
+    return {
+        "format": "lyrivox-index", "version": 1,
+        "rate": int(rate), "waveform": waveform, "duration": duration, "base_freq": base_freq,
+        "chars": len(text), "samples": int(bounds[-1]), "block_chars": block_chars,
+        "blocks": blocks,
+    }
+
+def write_index(path, index):
+    """Écrit l'index en JSON compact, à côté puis par remplacement (comme le WAV)."""
+    # Fichier temporaire propre à l'écrivain : deux écritures simultanées ne se volent pas leur fichier
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def load_index(path):
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get("format") != "lyrivox-index":
+        raise ValueError(f"{path} n'est pas un index Lyrivox.")
+    return index